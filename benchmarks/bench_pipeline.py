@@ -0,0 +1,168 @@
+"""Замер этапов parse, diff, push, snapshot и всего конвейера на синтетических данных без внешних сервисов.
+
+Запуск из каталога над репозиторием:
+    python -m cometa.benchmarks.bench_pipeline --rows 1000 10000 100000 1000000
+    python -m cometa.benchmarks.bench_pipeline --rows 10000 --stages push --latency 0.05 --p429 0.01 --p5xx 0.01
+
+Комета заменяется локальным HTTP-сервером (benchmarks/fakes.py), Google
+Таблицы — объектами в памяти, PostgreSQL — SQLite в памяти. Для каждого
+размера печатается время, строк в секунду и (с --memory) пиковый объем
+памяти этапа по tracemalloc; --json сохраняет результаты в файл. Этап
+pipeline прогоняет PushPipeline целиком (с дельтой по StateStore во
+временном каталоге) и печатает время каждого его этапа из отчета метрик.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, List
+
+from requests.adapters import HTTPAdapter
+
+from cometa.benchmarks.bench_settings_parser import make_sheet
+from cometa.benchmarks.fakes import FakeCometa, FakeSheets, SqliteDB
+from cometa.services import snapshot
+from cometa.services.cometa_client import CometaClient
+from cometa.services.metrics import metrics
+from cometa.services.pipeline import PushPipeline
+from cometa.services.rate_limit import TokenBucket
+from cometa.services.settings_diff import diff_against_hashes, settings_hash, settings_key
+from cometa.services.settings_parser import parse_settings
+from cometa.services.state_store import StateStore
+
+STAGES = ('parse', 'diff', 'push', 'snapshot', 'pipeline')
+
+
+def measure(func: Callable[[], object], memory: bool):
+    """(результат, секунды, пик памяти в МБ или None); с memory этап выполняется второй раз под tracemalloc"""
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def make_client(fake: FakeCometa, workers: int, rate: float) -> CometaClient:
+    client = CometaClient('bench', max_workers=workers, bucket=TokenBucket(rate=rate))
+    client.url = fake.url
+    client.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    return client
+
+
+def run(rows: int, args) -> List[dict]:
+    results = []
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    def report(stage: str, count: int, elapsed: float, peak, **extra) -> None:
+        entry = {'stage': stage, 'rows': count, 'seconds': round(elapsed, 4),
+                 'rows_per_second': round(count / elapsed) if elapsed else None,
+                 'peak_mb': round(peak, 1) if peak is not None else None, **extra}
+        results.append(entry)
+        memory = f" | пик {peak:8.1f} МБ" if peak is not None else ''
+        details = ''.join(f" | {k}: {v}" for k, v in extra.items())
+        print(f"{stage:<9} {count:>9} строк: {elapsed:8.3f} с | {entry['rows_per_second'] or 0:>10} строк/с{memory}{details}")
+
+    df = make_sheet(rows, dirty=True)
+    parsed, elapsed, peak = measure(lambda: [s.to_api_dict() for s in parse_settings(df, today).settings], args.memory)
+    payloads = parsed
+    if 'parse' in args.stages:
+        report('parse', rows, elapsed, peak)
+
+    if 'diff' in args.stages:
+        # Половина строк уже отправлена в том же виде — типичная дельта
+        known = {settings_key(p): settings_hash(p, today) for p in payloads[::2]}
+        diff, elapsed, peak = measure(lambda: diff_against_hashes(payloads, known, today), args.memory)
+        report('diff', len(payloads), elapsed, peak, to_send=len(diff.to_send))
+
+    if 'push' in args.stages:
+        batch = payloads[:args.push_limit] if args.push_limit else payloads
+        rnd = random.Random(1)
+        not_found = {p['product_id'] for p in batch if rnd.random() < args.not_found}
+        with FakeCometa(latency=args.latency, p429=args.p429, p5xx=args.p5xx, not_found=not_found,
+                        retry_after=args.retry_after) as fake:
+            client = make_client(fake, args.workers, args.rate)
+            client.gzip = args.gzip
+            metrics.reset()
+            reports, elapsed, peak = measure(lambda: client.push_partitioned(batch), args.memory)
+            requests_made = sum(r.requests for r in reports.values())
+            rejected = sum(len(r.rejected) for r in reports.values())
+            report('push', len(batch), elapsed, peak, requests=requests_made, rejected=rejected,
+                   responses=dict(fake.responses), wire_mb=round(metrics.counters['bytes_sent'] / 2 ** 20, 2),
+                   json_mb=round(fake.bytes_received / 2 ** 20, 2))
+
+    if 'snapshot' in args.stages:
+        with FakeCometa(latency=args.latency, record_count=rows) as fake, tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            # Кэш листов и отчеты метрик снимка пишутся во временный каталог
+            os.chdir(tmp)
+            try:
+                db = SqliteDB()
+                context = SimpleNamespace(cometa=make_client(fake, args.workers, args.rate), sheets=FakeSheets())
+                with db.patch(snapshot):
+                    job = snapshot.SnapshotJob(context)
+                    _, elapsed, peak = measure(job.run, args.memory)
+                    sheet = context.sheets.spreadsheet.worksheet(snapshot.CURRENT_SHEET)
+                    report('snapshot', rows, elapsed, peak, db_rows=db.rows_written, sheet_cells=sheet.cells_written)
+                    # Точечное обновление после отправки: 1% артикулов
+                    keys = set(zip(job.frame['api_key_id'], job.frame['product_id']))
+                    keys = set(random.Random(2).sample(sorted(keys), max(1, len(keys) // 100)))
+                    _, elapsed, _ = measure(lambda: job.run(keys), False)
+                    report('snapshot1%', len(keys), elapsed, None)
+            finally:
+                os.chdir(cwd)
+
+    if 'pipeline' in args.stages:
+        with FakeCometa(latency=args.latency, p429=args.p429, p5xx=args.p5xx) as fake, \
+                tempfile.TemporaryDirectory() as tmp:
+            state = StateStore(os.path.join(tmp, 'state.sqlite'))
+            # Чистый лист: артикулы вида 1e20 из грязного не помещаются в INTEGER SQLite
+            sheet = make_sheet(rows, dirty=False)
+            context = SimpleNamespace(cometa=make_client(fake, args.workers, args.rate), sheets=FakeSheets(sheet))
+            pipeline = PushPipeline(context, state=state, excluded_log_path=os.path.join(tmp, 'excluded.log'))
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                # Первый проход отправляет все, второй — только дельту (ничего)
+                for label in ('pipeline', 'pipeline2'):
+                    _, elapsed, _ = measure(lambda: pipeline.run(delta='state'), False)
+                    stages = metrics.report('push')['stages_seconds']
+                    report(label, rows, elapsed, None, **{k: round(v, 3) for k, v in stages.items()})
+            finally:
+                os.chdir(cwd)
+                state.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--memory', action='store_true', help="замерить пик памяти (этап выполняется повторно)")
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа сервера Кометы, сек.")
+    parser.add_argument('--p429', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--retry-after', type=float, help="Retry-After в ответах 429, сек.")
+    parser.add_argument('--p5xx', type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument('--not-found', type=float, default=0.0, help="доля артикулов, на которые сервер отвечает 400")
+    parser.add_argument('--gzip', action='store_true', help="сжимать тела POST (Content-Encoding: gzip)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=1000.0, help="потолок запросов в секунду")
+    parser.add_argument('--push-limit', type=int, default=0, help="отправлять не больше N строк (0 — все)")
+    parser.add_argument('--json', help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.rows:
+        results += run(n, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
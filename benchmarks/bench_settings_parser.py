@@ -0,0 +1,207 @@
+"""Замер колоночного парсера против построчных циклов iterrows.
+
+Запуск из каталога над репозиторием:
+    python -m cometa.benchmarks.bench_settings_parser --rows 1000 10000
+
+Скрипт генерирует синтетический лист «Настройки автопилота» (включая грязные
+значения: пустые ячейки, запятые, неразрывные пробелы, мусор) и печатает
+время обоих вариантов. Что результаты совпадают с прежним кодом, проверяет
+tests/test_settings_parser.py на тех же данных.
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from cometa.services.autopilot_settings import AutopilotSettings
+from cometa.services.settings_parser import SHEET_COLUMNS, build_params, parse_settings
+
+
+# --- Прежняя построчная логика (эталон) ---
+
+def legacy_parse_row(row):
+    """Копия AutopilotManager._parse_row из run.py"""
+    try:
+        def to_int(val):
+            v = str(val).strip().replace('\xa0', '')
+            return int(float(v)) if v and v.lower() != 'nan' and v != '' else None
+
+        def to_float(val):
+            v = str(val).strip().replace(',', '.').replace('\xa0', '')
+            return float(v) if v and v.lower() != 'nan' and v != '' else None
+
+        prod_id = to_int(row.get('Артикул'))
+        api_id = to_int(row.get('Идентификатор юрлица'))
+        if not prod_id or not api_id:
+            return None
+
+        settings = AutopilotSettings(api_key_id=api_id, product_id=prod_id)
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        act = str(row.get('Активность')).strip()
+        if act == '1': settings.active = True
+        elif act == '0': settings.active = False
+
+        min_c = to_float(row.get('Минимальный расход'))
+        if min_c is not None:
+            settings.min_daily_cost = [{"date": today, "cost": int(min_c)}]
+
+        max_c = to_int(row.get('Максимальный расход'))
+        if max_c is not None:
+            settings.max_daily_cost = max_c
+
+        drr = to_float(row.get('Целевой ДРР'))
+        drr_date = str(row.get('Дата, начиная с которой будет действовать целевой ДРР')).strip()
+        if drr is not None:
+            valid_date = drr_date if drr_date and drr_date != 'nan' else today
+            settings.target_drr = [{"date": valid_date, "drr": drr}]
+        return settings
+    except Exception:
+        return None
+
+
+def legacy_parse_settings(df):
+    """Цикл из AutopilotManager.run: (payload, exclusions)"""
+    payload, exclusions = [], []
+    for index, row in df.iterrows():
+        raw_prod_id = row.get('Артикул', 'Неизвестно')
+        item = legacy_parse_row(row)
+        if not item:
+            exclusions.append((index, raw_prod_id, "Ошибка формата данных или отсутствуют ID"))
+            continue
+        data = item.to_api_dict()
+        if len(data) <= 2:
+            exclusions.append((index, item.product_id, "Нет данных для обновления (все поля пустые)"))
+            continue
+        payload.append(data)
+    return payload, exclusions
+
+
+def legacy_build_params(df_settings):
+    """Сборка и очистка параметров из cometa_utils.main"""
+    df_settings = df_settings.rename(columns=SHEET_COLUMNS)
+
+    def to_int_or_none(x):
+        x = str(x).strip()
+        return int(x) if x and x != 'nan' else None
+
+    def to_float_or_none(x):
+        x = str(x).replace(',', '.').strip()
+        return float(x) if x and x != 'nan' and x != '' else None
+
+    def to_bool_or_none(x):
+        return True if str(x).strip() == '1' else (False if str(x).strip() == '0' else None)
+
+    def to_iso_date(date_str):
+        if not date_str or pd.isna(date_str):
+            return None
+        try:
+            return datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            try:
+                return datetime.strptime(date_str, "%d.%m.%Y").strftime("%Y-%m-%d")
+            except ValueError:
+                return None
+
+    params = []
+    for _, row in df_settings.iterrows():
+        params.append({
+            "api_key_id": to_int_or_none(row['api_key_id']),
+            "product_id": to_int_or_none(row['product_id']),
+            "active": to_bool_or_none(row['active']),
+            "target_drr": (
+                [{"date": to_iso_date(row['target_drr_date']), "drr": to_float_or_none(row['target_drr'])}]
+                if pd.notna(row['target_drr']) and pd.notna(row['target_drr_date']) else []
+            ),
+            "target_cost_override": (
+                [{"date": to_iso_date(row['target_cost_date']), "cost": to_float_or_none(row['target_cost_override'])}]
+                if pd.notna(row['target_cost_override']) and pd.notna(row['target_cost_date']) else []
+            ),
+            "min_rem": (
+                [{"quantity": to_int_or_none(row['quantity']), "size": str(row['size'])}]
+                if pd.notna(row['quantity']) and pd.notna(row['size']) else []
+            ),
+            "deposit_type": ([row['deposit_type']] if pd.notna(row['deposit_type']) else []),
+            "min_daily_cost": (
+                [{"date": datetime.now().strftime("%Y-%m-%d"), "cost": to_float_or_none(row['min_daily_cost'])}]
+            ),
+            "max_daily_cost": to_int_or_none(row['max_daily_cost'])
+        })
+
+    for p in params:
+        if not p['target_drr'] or all((not i['date'] or i['drr'] is None) for i in p['target_drr']):
+            p['target_drr'] = None
+        if not p['target_cost_override'] or all((not i['date'] or i['cost'] is None) for i in p['target_cost_override']):
+            p['target_cost_override'] = None
+        if not p['min_rem'] or not isinstance(p['min_rem'], list) or p['min_rem'][0].get('quantity') is None:
+            p['min_rem'] = None
+        if not p['deposit_type'] or all(d not in ['account', 'net', 'bonus'] for d in p['deposit_type']):
+            p['deposit_type'] = None
+        if not p['min_daily_cost'] or all((not i['date'] or i['cost'] is None) for i in p['min_daily_cost']):
+            p['min_daily_cost'] = None
+    return params
+
+
+# --- Синтетические данные ---
+
+def make_sheet(rows: int, seed: int = 42, dirty: bool = True) -> pd.DataFrame:
+    """Лист в том виде, в каком его отдает get_all_values(): все ячейки — строки.
+
+    dirty=True добавляет значения, на которых построчный парсер исключал строки;
+    build_params на них падает так же, как cometa_utils.main, поэтому для его
+    сверки используется dirty=False.
+    """
+    rnd = random.Random(seed)
+
+    def pick(clean, junk):
+        return rnd.choice(junk) if dirty and rnd.random() < 0.05 else rnd.choice(clean)
+
+    data = {name: [] for name in SHEET_COLUMNS}
+    for i in range(rows):
+        data['Идентификатор юрлица'].append(pick([str(rnd.randint(1, 12))], ['', 'nan', 'abc', '0', '3.7']))
+        data['Артикул'].append(pick([str(100000000 + i)], ['', '\xa0', 'x1', '1e20', 'inf']))
+        data['Активность'].append(rnd.choice(['1', '0', '', '']))
+        data['Дата, начиная с которой будет действовать целевой ДРР'].append(
+            rnd.choice(['', '2026-01-15', '15.01.2026', '2026-1-5', 'завтра']))
+        data['Целевой ДРР'].append(pick(['', '', '12', '7,5', '10.25', 'nan'], ['12%', '7,5,1']))
+        data['Дата, начиная с которой будет действовать целевой расход'].append(rnd.choice(['', '2026-02-01']))
+        data['Целевой расход'].append(rnd.choice(['', '', '1500', '99,9']))
+        data['Размер'].append(rnd.choice(['', '0', 'M']))
+        data['Количество'].append(rnd.choice(['', '5', '10']))
+        data['Счет автопополнения'].append(rnd.choice(['', 'account', 'net', 'bonus', 'card']))
+        data['Дата минимального расхода'].append('')
+        data['Минимальный расход'].append(pick(['', '', '500', '250,5'], ['много', '-inf', '1\xa0000']))
+        data['Максимальный расход'].append(pick(['', '3000', '5000'], ['3000,5', 'NaN']))
+    return pd.DataFrame(data)
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def measure(rows: int) -> None:
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    df = make_sheet(rows, dirty=True)
+    _, t_old = _timed(legacy_parse_settings, df)
+    parsed, t_new = _timed(parse_settings, df, today)
+    print(f"parse_settings  {rows:>8} строк: iterrows {t_old:8.3f} с | колоночный {t_new:8.3f} с | "
+          f"x{t_old / t_new:.1f} (к отправке {len(parsed.settings)}, исключено {len(parsed.exclusions)})")
+
+    df = make_sheet(rows, dirty=False)
+    _, t_old = _timed(legacy_build_params, df)
+    _, t_new = _timed(build_params, df, today)
+    print(f"build_params    {rows:>8} строк: iterrows {t_old:8.3f} с | колоночный {t_new:8.3f} с | "
+          f"x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    args = parser.parse_args()
+    for n in args.rows:
+        measure(n)
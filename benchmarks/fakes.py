@@ -0,0 +1,295 @@
+"""Локальные заменители внешних сервисов для бенчмарков.
+
+FakeCometa — HTTP-сервер с API /v1/autopilots (POST и потоковый GET) и
+настраиваемыми задержкой, 429 (с Retry-After или без), 5xx и ответами 400
+«артикул не найден».
+FakeSheets/FakeSpreadsheet/FakeWorksheet — то, что используют
+GoogleSheetClient и IncrementalSheetWriter, без обращения к Google.
+SqliteDB — замена функций utils_sql для снимка (COPY/upsert и чтение) на
+SQLite в памяти.
+"""
+import gzip
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Iterator, List, Optional
+from unittest import mock
+
+import pandas as pd
+from gspread.utils import a1_to_rowcol
+
+
+# --- Комета ---
+
+def make_records(count: int, seed: int = 7, stopped_share: float = 0.1) -> Iterator[dict]:
+    """Записи в формате GET /v1/autopilots; генерируются лениво, без списка в памяти"""
+    rnd = random.Random(seed)
+    for i in range(count):
+        yield {
+            'api_key_id': rnd.randint(1, 12),
+            'product_id': 100000000 + i,
+            'active': rnd.random() < 0.8,
+            'status': 'stopped' if rnd.random() < stopped_share else 'active',
+            'target_drr': [{'date': '2026-01-15', 'drr': rnd.choice([7.5, 10, 12])}] if rnd.random() < 0.6 else [],
+            'target_cost_override': [{'date': '2026-02-01', 'cost': 1500}] if rnd.random() < 0.3 else None,
+            'min_rem': [{'size': 'M', 'quantity': 5}] if rnd.random() < 0.2 else None,
+            'deposit_type': rnd.choice(['account', 'net', 'bonus']),
+            'min_daily_cost': [{'date': '2026-01-01', 'cost': rnd.choice([250, 500])}],
+            'max_daily_cost': rnd.choice([3000, 5000, 10000]),
+            'search_min_share': rnd.random(),
+            'brand_traffic': rnd.randint(0, 100),
+            'budget_spent_today': rnd.randint(0, 5000),
+            'target_cost': rnd.randint(100, 900),
+            'cost_to_target_pct_today': rnd.random() * 100,
+        }
+
+
+class _CometaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, code: int, body: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            if not fake.accept_gzip:
+                self._reply(415, {'detail': 'Unsupported Media Type'})
+                fake.record(415, 0)
+                return
+            body = gzip.decompress(body)
+        with fake.lock:
+            fake.bytes_received += len(body)
+        batch = json.loads(body)
+        if fake.latency:
+            time.sleep(fake.latency)
+        code = fake.roll()
+        if code == 200:
+            missing = next((p['product_id'] for p in batch if p.get('product_id') in fake.not_found), None)
+            if missing is not None:
+                code = 400
+                self._reply(400, {'detail': f"Product not found: {missing}"})
+            else:
+                self._reply(200, {'updated': len(batch)})
+        elif code == 429:
+            headers = {'Retry-After': str(fake.retry_after)} if fake.retry_after is not None else {}
+            self._reply(429, {'detail': 'Too Many Requests'}, headers)
+        else:
+            self._reply(code, {'detail': 'Service Unavailable'})
+        fake.record(code, len(batch))
+
+    def do_GET(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def chunk(text: str) -> None:
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+
+        parts = ['[']
+        size = 1
+        for i, record in enumerate(fake.records()):
+            parts.append((',' if i else '') + json.dumps(record, ensure_ascii=False))
+            size += len(parts[-1])
+            if size > 256 * 1024:
+                chunk(''.join(parts))
+                parts, size = [], 0
+        parts.append(']')
+        chunk(''.join(parts))
+        self.wfile.write(b"0\r\n\r\n")
+        fake.record(200, 0)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент закрывает соединения пула при завершении — это не ошибка сервера
+        pass
+
+
+class FakeCometa:
+    def __init__(self, latency: float = 0.0, p429: float = 0.0, p5xx: float = 0.0,
+                 not_found: Iterable[int] = (), record_count: int = 0, seed: int = 0,
+                 retry_after: Optional[float] = None, accept_gzip: bool = True):
+        self.latency = latency
+        # Retry-After в ответах 429 (None — без заголовка)
+        self.retry_after = retry_after
+        # False — на тело с Content-Encoding: gzip отвечать 415
+        self.accept_gzip = accept_gzip
+        self.p429 = p429
+        self.p5xx = p5xx
+        self.not_found = set(not_found)
+        self.record_count = record_count
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.responses = Counter()
+        self.rows_received = 0
+        # Объем тел POST после распаковки
+        self.bytes_received = 0
+        self.server = _Server(('127.0.0.1', 0), _CometaHandler)
+        self.server.fake = self
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/autopilots"
+
+    def records(self) -> Iterator[dict]:
+        return make_records(self.record_count)
+
+    def roll(self) -> int:
+        with self.lock:
+            value = self.rnd.random()
+        if value < self.p429:
+            return 429
+        if value < self.p429 + self.p5xx:
+            return 503
+        return 200
+
+    def record(self, code: int, rows: int) -> None:
+        with self.lock:
+            self.responses[code] += 1
+            if code == 200:
+                self.rows_received += rows
+
+    def __enter__(self) -> 'FakeCometa':
+        threading.Thread(target=self.server.serve_forever, name='fake-cometa', daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# --- Google Таблицы ---
+
+class FakeWorksheet:
+    def __init__(self, title: str, spreadsheet, rows: int = 1000, cols: int = 26):
+        self.title = title
+        self.id = abs(hash(title)) % 10 ** 6
+        self.spreadsheet = spreadsheet
+        self.row_count = rows
+        self.col_count = cols
+        self.grid: List[List[str]] = []
+        self.calls = Counter()
+        self.cells_written = 0
+
+    def get_all_values(self, **kwargs) -> List[List[str]]:
+        self.calls['get_all_values'] += 1
+        return [list(row) for row in self.grid]
+
+    def add_rows(self, count: int) -> None:
+        self.calls['add_rows'] += 1
+        self.row_count += count
+
+    def batch_update(self, data: List[dict], **kwargs) -> None:
+        self.calls['batch_update'] += 1
+        self.spreadsheet.touch()
+        for item in data:
+            start, _, _ = item['range'].partition(':')
+            top, left = a1_to_rowcol(start)
+            for i, values in enumerate(item['values']):
+                r = top - 1 + i
+                while len(self.grid) <= r:
+                    self.grid.append([])
+                row = self.grid[r]
+                if len(row) < left - 1 + len(values):
+                    row.extend([''] * (left - 1 + len(values) - len(row)))
+                row[left - 1:left - 1 + len(values)] = [str(v) for v in values]
+                self.cells_written += len(values)
+
+
+class FakeSpreadsheet:
+    def __init__(self, key: str = 'bench'):
+        self.id = key
+        self.worksheets = {}
+        # Время последнего изменения (секунды эпохи), как modifiedTime в Drive
+        self.modified = time.time()
+
+    def touch(self) -> None:
+        self.modified = time.time()
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        if title not in self.worksheets:
+            self.worksheets[title] = FakeWorksheet(title, self)
+        return self.worksheets[title]
+
+
+class FakeSheets:
+    """Заменитель GoogleSheetClient: лист настроек — готовый датафрейм"""
+
+    def __init__(self, frame: Optional[pd.DataFrame] = None):
+        self.frame = frame
+        self.spreadsheet = FakeSpreadsheet()
+
+    def open(self) -> FakeSpreadsheet:
+        return self.spreadsheet
+
+    def modified_time(self) -> str:
+        modified = datetime.fromtimestamp(self.spreadsheet.modified, timezone.utc)
+        return modified.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+    def get_data(self, worksheet_name: str, columns=None, refresh: bool = False,
+                 revision: Optional[str] = None) -> pd.DataFrame:
+        return self.frame if columns is None else self.frame[[c for c in columns if c in self.frame]]
+
+
+# --- БД ---
+
+class SqliteDB:
+    """SQLite в памяти вместо PostgreSQL для снимка: тот же upsert по ключу и чтение в датафрейм"""
+
+    def __init__(self, path: str = ':memory:'):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.rows_written = 0
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+    def copy_upsert(self, connection, df: pd.DataFrame, table: str,
+                    key_columns=('date', 'api_key_id', 'product_id')) -> int:
+        columns = list(df.columns)
+        quoted = ', '.join(f'"{c}"' for c in columns)
+        keys = ', '.join(f'"{c}"' for c in key_columns)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({quoted})')
+        connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_key" ON "{table}" ({keys})')
+        updates = ', '.join(f'"{c}" = excluded."{c}"' for c in columns if c not in key_columns)
+        rows = df.astype(object).where(df.notna(), None).values.tolist()
+        with connection:
+            connection.executemany(
+                f'INSERT INTO "{table}" ({quoted}) VALUES ({", ".join("?" * len(columns))}) '
+                f'ON CONFLICT ({keys}) DO UPDATE SET {updates}', rows)
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def read(self, query: str, connection, params=None, chunksize=None) -> pd.DataFrame:
+        try:
+            return pd.read_sql_query(query.replace('%s', '?'), connection, params=params).fillna(0)
+        except pd.errors.DatabaseError:
+            # Таблицы еще нет (первый снимок) — как пустой результат
+            return pd.DataFrame()
+
+    def patch(self, module):
+        """Подменяет функции utils_sql, импортированные в module"""
+        return mock.patch.multiple(module, db_connection=self.connection,
+                                   copy_upsert_dataframe=self.copy_upsert, get_db_table=self.read)
@@ -0,0 +1,22 @@
+"""Регистрация папки репозитория как пакета cometa при запуске скриптом.
+
+Модули импортируют друг друга как cometa.services.X. При запуске через
+python -m cometa.<модуль> из каталога над репозиторием пакет находится
+сам; при запуске скриптом (python run.py, python main/main.py, cron) или
+тестами папка регистрируется как пакет cometa, под каким бы именем ее ни
+склонировали. Скрипт в корне импортирует этот модуль напрямую, скрипт из
+подпапки — добавив корень репозитория в sys.path:
+
+    if not __package__:
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+        import cometa_bootstrap  # noqa: F401
+"""
+import sys
+import types
+from pathlib import Path
+
+try:
+    import cometa  # noqa: F401
+except ModuleNotFoundError:
+    sys.modules['cometa'] = types.ModuleType('cometa')
+    sys.modules['cometa'].__path__ = [str(Path(__file__).resolve().parent)]
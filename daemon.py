@@ -0,0 +1,160 @@
+"""Демон Кометы: отправка настроек и снимок в одном долгоживущем процессе.
+
+Клиенты (HTTP-сессия Кометы, Google Таблицы, пул соединений с БД) создаются
+один раз и остаются «теплыми» между запусками. Задачи выполняются по очереди
+в одном потоке, поэтому не пересекаются; второй экземпляр демона не
+запустится, пока жив первый (блокировка файла). После каждой отправки сразу
+обновляется снимок только отправленных артикулов.
+
+В режиме --watch демон между плановыми запусками следит за листом настроек
+(опрос ревизии и/или вебхук от Apps Script) и за секунды отправляет только
+отредактированные строки. Плановая отправка остается страховкой.
+"""
+import argparse
+import fcntl
+import os
+import signal
+import threading
+import time
+from typing import Optional
+
+if not __package__:
+    # Запуск скриптом (python daemon.py, cron): см. cometa_bootstrap
+    import cometa_bootstrap  # noqa: F401
+
+from cometa.main.utils_sql import close_pool
+from cometa.services.autopilot_manager import AutopilotManager
+from cometa.services.context import AppContext, load_env
+from cometa.services.logger import setup_logger
+from cometa.services.pipeline import SETTINGS_SHEET
+from cometa.services.settings_parser import SHEET_COLUMNS, SHEET_KEY_COLUMNS
+from cometa.services.sheet_watch import SheetWatcher, start_webhook
+from cometa.services.snapshot import SnapshotJob
+
+log = setup_logger()
+
+LOCK_PATH = 'cometa_daemon.lock'
+
+
+class CometaDaemon:
+    def __init__(self, push_interval: float, snapshot_interval: float, delta: Optional[str] = 'state',
+                 watch_interval: Optional[float] = None):
+        self.push_interval = push_interval
+        self.snapshot_interval = snapshot_interval
+        self.delta = delta
+        self.context = AppContext('creds/creds.json')
+        self.manager = AutopilotManager(self.context)
+        self.snapshot = SnapshotJob(self.context)
+        self.stopped = threading.Event()
+        # Будит цикл раньше срока: остановка или вебхук о правке листа
+        self.wakeup = threading.Event()
+        self.edited = threading.Event()
+        self.watch_interval = watch_interval
+        self.watcher = SheetWatcher(self.context.sheets, SETTINGS_SHEET, list(SHEET_COLUMNS),
+                                    key_columns=SHEET_KEY_COLUMNS) if watch_interval else None
+
+    def stop(self, *_) -> None:
+        log.info("Остановка демона: текущая задача будет доведена до конца")
+        self.stopped.set()
+        self.wakeup.set()
+
+    def notify_edit(self) -> None:
+        self.edited.set()
+        self.wakeup.set()
+
+    def _safe(self, name: str, func, *args, **kwargs):
+        """Ошибка задачи пишется в лог и не останавливает демон"""
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+            log.info(f"⏱️ {name}: {time.monotonic() - started:.1f} сек.")
+            return result
+        except Exception as e:
+            log.exception(f"❌ {name} завершилась с ошибкой: {e}")
+            return None
+
+    def run_forever(self) -> None:
+        # Сначала полный снимок (основа для точечных обновлений), затем отправка
+        next_snapshot = next_push = next_watch = time.monotonic()
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            if now >= next_snapshot:
+                next_snapshot = now + self.snapshot_interval
+                self._safe("Снимок", self.snapshot.run)
+            elif now >= next_push:
+                next_push = now + self.push_interval
+                sent = self._safe("Отправка", self.manager.run, delta=self.delta)
+                self._resnapshot(sent)
+            elif self.watcher and (self.edited.is_set() or now >= next_watch):
+                next_watch = now + self.watch_interval
+                forced = self.edited.is_set()
+                self.edited.clear()
+                self._safe("Проверка листа", self._push_edits, forced)
+            deadlines = [next_snapshot, next_push] + ([next_watch] if self.watcher else [])
+            self.wakeup.wait(max(0.0, min(deadlines) - time.monotonic()))
+            self.wakeup.clear()
+
+    def _resnapshot(self, sent) -> None:
+        if sent:
+            log.info(f"Обновляем снимок отправленных артикулов: {len(sent)}")
+            self._safe("Точечный снимок", self.snapshot.run, sent)
+
+    def _push_edits(self, forced: bool) -> None:
+        """Отправляет строки, отредактированные с прошлой проверки"""
+        edited = self.watcher.poll(force=forced)
+        if edited is None or edited.empty:
+            return
+        # Вместе с правкой уходят и строки с тем же ключом: повторы сливаются так же, как при полной отправке
+        log.info(f"✏️ Изменено строк на листе (с повторами ключа): {len(edited)}")
+        # Тот же режим, что у плановой отправки: --delta state еще и отсекает строки, уже отправленные в таком виде
+        self._resnapshot(self.manager.run(delta=self.delta, df=edited))
+
+    def close(self) -> None:
+        self.manager.close()
+        close_pool()
+
+
+def main():
+    load_env()
+    parser = argparse.ArgumentParser(description="Отправка настроек и снимок Кометы по расписанию в одном процессе")
+    parser.add_argument('--push-interval', type=float, default=float(os.getenv('COMETA_PUSH_INTERVAL', 600)),
+                        help="период отправки настроек, сек.")
+    parser.add_argument('--snapshot-interval', type=float, default=float(os.getenv('COMETA_SNAPSHOT_INTERVAL', 3600)),
+                        help="период полного снимка, сек.")
+    parser.add_argument('--delta', choices=['state', 'snapshot', 'none'], default='state',
+                        help="какие настройки отправлять: изменившиеся с прошлой отправки, отличающиеся от снимка или все "
+                             "(и по расписанию, и в режиме --watch)")
+    parser.add_argument('--watch', action='store_true',
+                        help="между плановыми запусками сразу отправлять отредактированные строки листа")
+    parser.add_argument('--watch-interval', type=float, default=float(os.getenv('COMETA_WATCH_INTERVAL', 15)),
+                        help="период проверки ревизии листа в режиме --watch, сек.")
+    parser.add_argument('--webhook-port', type=int, default=int(os.getenv('COMETA_WEBHOOK_PORT', 0)),
+                        help="порт вебхука правок от Apps Script (0 — не слушать)")
+    parser.add_argument('--webhook-host', default=os.getenv('COMETA_WEBHOOK_HOST', '127.0.0.1'))
+    args = parser.parse_args()
+
+    with open(LOCK_PATH, 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log.error(f"Демон уже запущен (занят {LOCK_PATH})")
+            raise SystemExit(1)
+
+        daemon = CometaDaemon(args.push_interval, args.snapshot_interval,
+                              delta=None if args.delta == 'none' else args.delta,
+                              watch_interval=args.watch_interval if args.watch else None)
+        if args.watch and args.webhook_port:
+            start_webhook(args.webhook_port, daemon.notify_edit, host=args.webhook_host,
+                          token=os.getenv('COMETA_WEBHOOK_TOKEN'))
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        log.info(f"Демон запущен: отправка каждые {args.push_interval:.0f} сек., "
+                 f"снимок каждые {args.snapshot_interval:.0f} сек.")
+        try:
+            daemon.run_forever()
+        finally:
+            daemon.close()
+
+
+if __name__ == "__main__":
+    main()
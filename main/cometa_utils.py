@@ -1,83 +1,22 @@
-import gspread
-import time
 import logging
-import pandas as pd
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-import json
+from datetime import datetime
 import os
-import requests
 from colorlog import ColoredFormatter
 
+from cometa.services.context import AppContext
+from cometa.services.logger import add_file_handler
+from cometa.services.not_found_cache import NotFoundCache
+from cometa.services.pipeline import PushPipeline
+from cometa.services.settings_parser import parse_params
 
 
-def safe_open_spreadsheet(title, retries=5, delay=5):
-    """
-    Пытается открыть таблицу с повторными попытками при APIError 503.
-    """
-    gc = gspread.service_account(filename=os.path.join(os.path.dirname(__file__), 'creds.json'))
-    
-    for attempt in range(1, retries + 1):
-        print(f"[Попытка {attempt}] открыть доступ к таблице '{title}'")
-        
-        try:
-            spreadsheet = gc.open(title)
-            print(f"✅ Таблица '{title}' успешно открыта")
-            return spreadsheet
-            
-        except gspread.exceptions.APIError as e:
-            error_code = e.response.status_code if hasattr(e, 'response') else None
-
-            print(f"⚠️ [Попытка {attempt}/{retries}] APIError {error_code}: {e}")
-            
-            if error_code == 503:
-                if attempt < retries:
-                    print(f"⏳ Ожидание {delay} секунд перед повторной попыткой...")
-                    time.sleep(delay)
-                    # Увеличиваем задержку для следующей попытки (exponential backoff)
-                    delay *= 2
-                else:
-                    print("❌ Все попытки исчерпаны")
-                    raise
-            else:
-                # Другие ошибки API (403, 404 и т.д.) - не повторяем
-                raise
-                
-        except gspread.SpreadsheetNotFound:
-            print(f"❌ Таблица '{title}' не найдена")
-            raise
-            
-        except Exception as e:
-            print(f"⚠️ [Попытка {attempt}/{retries}] Неожиданная ошибка: {e}")
-            if attempt < retries:
-                print(f"⏳ Ожидание {delay} секунд...")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                raise RuntimeError(f"Не удалось открыть таблицу '{title}' после {retries} попыток.")
-            
-def batchify(data, batch_size):
-    """
-    Splits data into batches of a specified size.
-
-    Parameters:
-    - data: The list of items to be batched.
-    - batch_size: The size of each batch.
-
-    Returns:
-    - A generator yielding batches of data.
-    """
-    for i in range(0, len(data), batch_size):
-        yield data[i:i + batch_size]
-
 
 # Настройка логирования
 # Настройка логирования
 logger = logging.getLogger("cometa_logger")
-logger.setLevel(logging.INFO)
+logger.setLevel(os.getenv('COMETA_LOG_LEVEL', 'INFO').upper())
 
 # Форматтеры
-file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 color_formatter = ColoredFormatter(
     "%(log_color)s%(levelname)-8s%(reset)s %(message)s",
     datefmt=None,
@@ -91,183 +30,24 @@ color_formatter = ColoredFormatter(
     }
 )
 
-# Хендлеры
-file_handler = logging.FileHandler('cometa_change_settings_dashboard.log', encoding='utf-8')
-file_handler.setFormatter(file_formatter)
+# Хендлеры: файл с ротацией пишется фоновым потоком (общий для всех логгеров этого файла)
+add_file_handler(logger, 'cometa_change_settings_dashboard.log')
 
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(color_formatter)
 
-logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
 
 def main():
-    # Открываем таблицу
-    table = safe_open_spreadsheet("Панель управления продажами Вектор")
-    sheet = table.worksheet("Настройки автопилота").get_all_values()
-    df_settings = pd.DataFrame(sheet[1:], columns=sheet[0])
-    logger.info(f"Получено {len(df_settings)} записей из гугл-таблицы")
-
-    # Переименовываем колонки
-    df_settings = df_settings.rename(columns={
-        'Идентификатор юрлица': 'api_key_id',
-        'Артикул': 'product_id',
-        'Активность': 'active',
-        'Дата, начиная с которой будет действовать целевой ДРР': 'target_drr_date',
-        'Целевой ДРР': 'target_drr',
-        'Дата, начиная с которой будет действовать целевой расход': 'target_cost_date',
-        'Целевой расход': 'target_cost_override',
-        'Размер': 'size',
-        'Количество': 'quantity',
-        'Счет автопополнения': 'deposit_type',
-        'Дата минимального расхода': 'min_daily_cost_date',
-        'Минимальный расход': 'min_daily_cost',
-        'Максимальный расход': 'max_daily_cost'
-    })
-
-    # Функции для преобразования
-    def to_int_or_none(x):
-        x = str(x).strip()
-        return int(x) if x and x != 'nan' else None
-
-    def to_float_or_none(x):
-        x = str(x).replace(',', '.').strip()
-        return float(x) if x and x != 'nan' and x != '' else None
-
-    def to_bool_or_none(x):
-        return True if str(x).strip() == '1' else (False if str(x).strip() == '0' else None)
-
-    def to_iso_date(date_str):
-        if not date_str or pd.isna(date_str):
-            return None
-        try:
-            return datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-%m-%d")
-        except ValueError:
-            try:
-                return datetime.strptime(date_str, "%d.%m.%Y").strftime("%Y-%m-%d")
-            except ValueError:
-                return None
-
-    # Сбор параметров
-    params = []
-    for _, row in df_settings.iterrows():
-        obj = {
-            "api_key_id": to_int_or_none(row['api_key_id']),
-            "product_id": to_int_or_none(row['product_id']),
-            "active": to_bool_or_none(row['active']),
-            "target_drr": (
-                [{"date": to_iso_date(row['target_drr_date']), "drr": to_float_or_none(row['target_drr'])}]
-                if pd.notna(row['target_drr']) and pd.notna(row['target_drr_date']) else []
-            ),
-            "target_cost_override": (
-                [{"date": to_iso_date(row['target_cost_date']), "cost": to_float_or_none(row['target_cost_override'])}]
-                if pd.notna(row['target_cost_override']) and pd.notna(row['target_cost_date']) else []
-            ),
-            "min_rem": (
-                [{"quantity": to_int_or_none(row['quantity']), "size": str(row['size'])}]
-                if pd.notna(row['quantity']) and pd.notna(row['size']) else []
-            ),
-            "deposit_type": ([row['deposit_type']] if pd.notna(row['deposit_type']) else []),
-
-
-
-            # "min_daily_cost": to_int_or_none(row['min_daily_cost']) - старая настройка мин расхода,
-            "min_daily_cost": (
-                [{"date": datetime.now().strftime("%Y-%m-%d"), "cost": to_float_or_none(row['min_daily_cost'])}]
-            ),            
-            "max_daily_cost": to_int_or_none(row['max_daily_cost'])
-        }
-        params.append(obj)
-
-    logger.info("Сформирован словарь параметров")
-
-    # Фильтруем пустые записи
-    final_params = []
-    for param in params:
-        # Проверяем целевой расход 
-        target_cost = param['target_cost_override'][0]['cost'] if param['target_cost_override'] else None
-        # Проверяем целевой ДРР
-        target_drr = param['target_drr'][0]['drr'] if param['target_drr'] else None
-        # Если все ключевые параметры пусты и автопилот не деактивирован, пропускаем запись
-        if (param['max_daily_cost'] is None
-                and param['min_daily_cost'] is None
-                and target_cost is None
-                and target_drr is None
-                and param['active'] is not False):
-            logger.info(f"Удалён product_id: {param['product_id']}")
-        else:
-            final_params.append(param)
-        
-
-    # Чистим данные
-    for p in final_params:
-        if not p['target_drr'] or all((not i['date'] or i['drr'] is None) for i in p['target_drr']):
-            p['target_drr'] = None
-        if not p['target_cost_override'] or all((not i['date'] or i['cost'] is None) for i in p['target_cost_override']):
-            p['target_cost_override'] = None
-        if not p['min_rem'] or not isinstance(p['min_rem'], list) or p['min_rem'][0].get('quantity') is None:
-            p['min_rem'] = None
-        if not p['deposit_type'] or all(d not in ['account', 'net', 'bonus'] for d in p['deposit_type']):
-            p['deposit_type'] = None
-
-        #  Проверка min_daily_cost на наличие значений
-        if not p['min_daily_cost'] or all((not i['date'] or i['cost'] is None) for i in p['min_daily_cost']):
-            p['min_daily_cost'] = None        
-        
-
-    logger.info(f"Сформированы параметры для передачи настроек в Комету")
-
-    # Нарезаем параметры на батчи
-    batches = list(batchify(final_params, 1000))
-
-    # Загружаем ключ
-    load_dotenv()
-    cometa_api_key = os.getenv('COMETA_API_KEY') 
-    url_change_settings = 'https://api.e-comet.io/v1/autopilots'
-    headers = {'Authorization': cometa_api_key}
-    count_sent_params = 0
-    count_unsent_params = 0
-    for batch in batches:
-        # Отправка запроса
-        max_attempts = 10
-        attempts = 0
-        success = False
-        while attempts != max_attempts and not success:
-            try:
-                logger.info("Отправляем POST запрос в Комету")
-                response = requests.post(url_change_settings, headers=headers, json=batch)
-                if response.status_code == 200:
-                    count_sent_params += 1
-                    logger.info(f"Настройки автопилота успешно применены:\n{json.dumps(response.json(), indent=2, ensure_ascii=False)}\nВремя: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
-                    success = True
-                elif response.status_code == 429:
-                    logger.info(f"Ошибка 429. Слишком много запросов. {response.text}")
-                    time.sleep(attempts+1)
-                elif response.status_code == 422:
-                    logger.info(f"Ошибка 422. Неверный формат данных. {response.text}")
-                    attempts += 1
-                    count_unsent_params +=1
-                elif response.status_code == 401:
-                    logger.info(f"Ошибка 401. Неверный API ключ. {response.text}")
-                elif response.status_code == 403:
-                    logger.info(f"Ошибка 403. Недостаточно прав. {response.text}")
-                elif response.status_code >= 500:
-                    logger.info(f"Ошибка 500. Проблема на сервере. {response.text}")
-                    attempts += 1
-                    count_unsent_params +=1
-                elif response.status_code == 400:
-                    logger.info(f"Ошибка 400. {response.text}")
-                    count_unsent_params +=1
-                    try:
-                        error_data = response.json()
-                        not_found_article = int(error_data['detail'].split(': ')[1])
-                        batch = [item for item in batch if item.get('product_id') != not_found_article]
-                    except Exception:
-                        pass
-                else:
-                    logger.info(f"Неожиданный статус ответа {response.status_code}. Ответ сервера: {response.text}")
-            except requests.exceptions.RequestException as e:
-                logger.info(f"Ошибка запроса к серверу: {e}")
-
-        logger.info(f"Отработка завершена {datetime.now().strftime('%Y-%m-%d %H-%M')} - Успешно отправлено: {count_sent_params}, Неотправлено: {count_unsent_params}")
+    # Тот же конвейер, что и run.py (чтение колонок с кэшем, адаптивные батчи по юрлицам,
+    # изоляция отвергнутых артикулов), но с правилами разбора этого скрипта
+    context = AppContext(os.path.join(os.path.dirname(__file__), 'creds.json'))
+    # Артикулы, ненайденные в прошлых запусках, отбрасываются до отправки
+    not_found = NotFoundCache()
+    pipeline = PushPipeline(context, parse=parse_params, logger=logger, not_found=not_found)
+    try:
+        pipeline.run()
+    finally:
+        not_found.close()
+    logger.info(f"Отработка завершена {datetime.now().strftime('%Y-%m-%d %H-%M')}")
@@ -1,7 +1,17 @@
-from cometa_utils import main
+import sys
+from pathlib import Path
+
+if not __package__:
+    # Запуск скриптом (python main/main.py, cron): см. cometa_bootstrap
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import cometa_bootstrap  # noqa: F401
+
+from cometa.main.cometa_utils import main
 import logging
 from colorlog import ColoredFormatter
 
+from cometa.services.logger import add_file_handler
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -20,14 +30,11 @@ formatter = ColoredFormatter(
     }
 )
 
-# Обработчики
-file_handler = logging.FileHandler('cometa_change_settings_dashboard.log', encoding='utf-8')
+# Обработчики: файл общий с cometa_utils (одна очередь и одна ротация на файл)
 console_handler = logging.StreamHandler()
-
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 console_handler.setFormatter(formatter)
 
-logger.addHandler(file_handler)
+add_file_handler(logger, 'cometa_change_settings_dashboard.log')
 logger.addHandler(console_handler)
 
 if __name__ == "__main__":
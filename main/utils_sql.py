@@ -1,16 +1,23 @@
 """Функции для работы с БД"""
+import io
+import os
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import sql
 from psycopg2 import OperationalError
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 import pandas as pd
-from sqlalchemy import create_engine
 from datetime import datetime
-from dotenv import load_dotenv
 
-load_dotenv()
+from cometa.services.context import load_env
+from cometa.services.metrics import metrics
+from cometa.services.retry import CircuitBreaker, RetryPolicy
+
+load_env()
 
 # Подключение к базе данных
 def create_connection(db_name, db_user, db_password, db_host, db_port):
-    connection = None
     try:
         connection = psycopg2.connect(
             database=db_name,
@@ -22,8 +29,82 @@ def create_connection(db_name, db_user, db_password, db_host, db_port):
         print(f"Соединение с БД PostgreSQL успешно установлено в {datetime.now().strftime('%Y-%m-%d-%H:M')}")
     except OperationalError as error:
         print(f"Произошла ошибка при подключении к БД PostgreSQL {error}")
+        raise
     return connection
 
+# Пул соединений: один на процесс, соединения переиспользуются между запусками задач
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Пул соединений с параметрами из .env (USER_2, NAME_2, ...).
+
+    Размер ограничен DB_POOL_MAX (по умолчанию 5); TCP keepalive не дает
+    простаивающим соединениям тихо умереть за NAT/балансировщиком.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ThreadedConnectionPool(
+                minconn=1,
+                maxconn=int(os.getenv('DB_POOL_MAX', 5)),
+                database=os.getenv('NAME_2'),
+                user=os.getenv('USER_2'),
+                password=os.getenv('PASSWORD_2'),
+                host=os.getenv('HOST_2'),
+                port=os.getenv('PORT_2'),
+                keepalives=1,
+                keepalives_idle=60,
+            )
+            print(f"Пул соединений с БД PostgreSQL создан в {datetime.now().strftime('%Y-%m-%d-%H:%M')}")
+        return _pool
+
+def _is_alive(connection):
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+# Недоступная БД (рестарт, сеть, пул исчерпан): повторы с паузой, после серии неудач — предохранитель
+_DB_RETRY = RetryPolicy(attempts=int(os.getenv('DB_RETRY_ATTEMPTS', 5)), base=1.0, max_delay=30.0, deadline=60.0)
+_DB_BREAKER = CircuitBreaker('PostgreSQL')
+
+def _checkout():
+    pool = get_pool()
+    connection = pool.getconn()
+    if not _is_alive(connection):
+        pool.putconn(connection, close=True)
+        connection = pool.getconn()
+    return pool, connection
+
+@contextmanager
+def db_connection():
+    """Соединение из пула: проверяется перед выдачей и возвращается в пул после блока.
+
+    Незавершенная транзакция откатывается, разорванное соединение закрывается,
+    и пул при следующем запросе откроет новое.
+    """
+    pool, connection = _DB_RETRY.call(_checkout, retryable=lambda e: isinstance(e, (OperationalError, PoolError)),
+                                      breaker=_DB_BREAKER, name="Подключение к БД")
+    try:
+        yield connection
+    finally:
+        if not connection.closed and connection.status != psycopg2.extensions.STATUS_READY:
+            connection.rollback()
+        pool.putconn(connection, close=bool(connection.closed))
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
 # Исполнение SQL запросов
 def execute_query(connection, query, data=None):
     cursor = connection.cursor()
@@ -41,25 +122,150 @@ def execute_query(connection, query, data=None):
         cursor.close()
 
 # Функция на чтение данных из БД
-def execute_read_query(connection, query):
+def execute_read_query(connection, query, params=None):
     cursor = connection.cursor()
     result = None
     try:
-        cursor.execute(query)
+        cursor.execute(query, params)
         result = cursor.fetchall()
         return result
     except OperationalError as error:
         print(f'Произошла ошибка при выводе данных {error}')
+    finally:
+        cursor.close()
+
+# Сборка датафрейма из результата курсора
+def _frame(rows, description):
+    # coerce_float: numeric (Decimal) сразу становится float, даты остаются датами
+    return pd.DataFrame.from_records(rows, columns=[col.name for col in description], coerce_float=True)
+
+# Потоковое чтение через серверный (именованный) курсор
+def _iter_db_chunks(db_query, connection, params, chunksize):
+    cursor = connection.cursor(name=f"get_db_table_{id(db_query)}")
+    cursor.itersize = chunksize
+    try:
+        with metrics.stage('db_read'):
+            cursor.execute(db_query, params)
+        while True:
+            # В db_read — только чтение порции, а не обработка ее вызывающим кодом между yield
+            with metrics.stage('db_read'):
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                df = _frame(rows, cursor.description)
+            metrics.add('db_rows_read', len(df))
+            yield df
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
 
 # Функция для получения датафрейма из БД
-def get_db_table(db_query: str, connection):
-    """Функция получает данные из Базы Данных и преобразует их в датафрейм"""
-    execute_read_query(connection, db_query)
-    # Преобразуем таблицу в датафрейм
+def get_db_table(db_query: str, connection, params=None, chunksize=None):
+    """Функция получает данные из Базы Данных и преобразует их в датафрейм.
+
+    Запрос выполняется один раз, значения передаются через params (%s),
+    колонки приходят типизированными. С chunksize возвращает генератор
+    датафреймов, читая данные серверным курсором порциями по chunksize строк.
+    Ошибка запроса откатывает транзакцию и пробрасывается дальше.
+    """
+    if chunksize:
+        return _iter_db_chunks(db_query, connection, params, chunksize)
+    cursor = connection.cursor()
     try:
-        df_db = pd.read_sql(db_query, connection).fillna(0).infer_objects(copy=False)
+        with metrics.stage('db_read'):
+            cursor.execute(db_query, params)
+            df_db = _frame(cursor.fetchall(), cursor.description).fillna(0).infer_objects(copy=False)
+        metrics.add('db_rows_read', len(df_db))
         print('Данные из БД загружены в датафрейм')
         return df_db
     except Exception as e:
-
+        connection.rollback()
         print(f'Ошибка получения данных из БД {e}')
+        raise
+    finally:
+        cursor.close()
+
+
+# Уникальные индексы, уже проверенные в этом процессе: (таблица, ключ)
+_unique_indexes = set()
+
+def ensure_unique_index(connection, table: str, key_columns) -> None:
+    """Создает уникальный индекс по key_columns, если его нет: без него ON CONFLICT не работает.
+
+    Если в таблице уже есть повторы ключа, CREATE UNIQUE INDEX упадет с ошибкой —
+    это лучше, чем молча не сохранять снимки. Проверяется один раз за процесс.
+    """
+    if (table, tuple(key_columns)) in _unique_indexes:
+        return
+    index = f"{table}_{'_'.join(key_columns)}_key"
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} ({keys})").format(
+            index=sql.Identifier(index), table=sql.Identifier(table),
+            keys=sql.SQL(', ').join(map(sql.Identifier, key_columns))))
+    connection.commit()
+    _unique_indexes.add((table, tuple(key_columns)))
+
+
+# Массовая загрузка датафрейма через COPY
+@metrics.timed('db_write')
+def copy_upsert_dataframe(connection, df: pd.DataFrame, table: str, key_columns=('date', 'api_key_id', 'product_id')):
+    """Загружает датафрейм в таблицу одним COPY FROM STDIN с upsert по ключу.
+
+    Данные сначала копируются во временную staging-таблицу, затем одним
+    INSERT ... ON CONFLICT переносятся в целевую. Уникальный индекс по
+    key_columns создается при первом вызове, если его нет. Если ключ
+    повторяется внутри датафрейма, записывается последняя из его строк.
+    NaN/None записываются как NULL. Возвращает число загруженных строк;
+    ошибка откатывает транзакцию и пробрасывается вызывающему.
+    """
+    ensure_unique_index(connection, table, key_columns)
+    columns = list(df.columns)
+    staging = f"{table}_staging"
+
+    # Целые значения, ставшие float из-за пропусков (1500.0), COPY в integer не примет
+    df = df.copy()
+    for col in df.select_dtypes(include='float').columns:
+        values = df[col].dropna()
+        if len(values) and (values % 1 == 0).all():
+            df[col] = df[col].astype('Int64')
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    cols = sql.SQL(', ').join(map(sql.Identifier, columns))
+    keys = sql.SQL(', ').join(map(sql.Identifier, key_columns))
+    updates = sql.SQL(', ').join(
+        sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(col))
+        for col in columns if col not in key_columns
+    )
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql.SQL("CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP").format(
+            staging=sql.Identifier(staging), table=sql.Identifier(table)))
+        # Номер строки в порядке COPY: по нему из повторов ключа выбирается последняя
+        cursor.execute(sql.SQL("ALTER TABLE {staging} ADD COLUMN _copy_row bigserial").format(
+            staging=sql.Identifier(staging)))
+        cursor.copy_expert(sql.SQL("COPY {staging} ({cols}) FROM STDIN WITH (FORMAT csv, NULL '')").format(
+            staging=sql.Identifier(staging), cols=cols).as_string(connection), buffer)
+        # DISTINCT ON: повтор ключа внутри снимка не должен ломать ON CONFLICT
+        cursor.execute(sql.SQL("""
+            INSERT INTO {table} ({cols})
+            SELECT DISTINCT ON ({keys}) {cols} FROM {staging}
+            ORDER BY {keys}, _copy_row DESC
+            ON CONFLICT ({keys}) DO UPDATE SET {updates}
+        """).format(table=sql.Identifier(table), staging=sql.Identifier(staging),
+                    cols=cols, keys=keys, updates=updates))
+        connection.commit()
+        metrics.add('db_rows_written', len(df))
+        metrics.add('db_bytes_sent', len(buffer.getvalue()))
+        print(f"Загружено {len(df)} строк в {table} в {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+        return len(df)
+    except Exception as e:
+        connection.rollback()
+        print(f"Ошибка загрузки данных в {table}: {e}")
+        raise
+    finally:
+        cursor.close()
@@ -1,24 +1,66 @@
-from dotenv import load_dotenv
 import os
+from typing import Optional, Set
 
-from cometa.services.logger import setup_logger
-from cometa.services.cometa_client import CometaClient
-from cometa.services.google_sheet_client import GoogleSheetClient
+import pandas as pd
+
+from cometa.services.context import AppContext, load_env
+from cometa.services.logger import add_file_handler, setup_logger
+from cometa.services.not_found_cache import NotFoundCache
+from cometa.services.pipeline import PushPipeline
+from cometa.services.push_journal import PushJournal
+from cometa.services.settings_diff import SettingsKey
+from cometa.services.state_store import StateStore
 
 log = setup_logger()
 
 class AutopilotManager:
-    def __init__(self):
-        load_dotenv()
+    def __init__(self, context: Optional[AppContext] = None):
+        load_env()
         # Загружаем ключ и проверяем его наличие
         api_key = os.getenv('COMETA_API_KEY')
         if not api_key:
             log.error("API ключ COMETA_API_KEY не найден в .env")
             raise ValueError("Missing API Key")
 
-        # Инициализируем клиенты
-        self.gs_client = GoogleSheetClient('creds/creds.json', "Панель управления продажами Вектор")
-        self.cometa_client = CometaClient(api_key)
-        
+        # Клиенты берутся из общего контекста: создаются один раз, токен Google кэшируется на диске
+        self.context = context or AppContext('creds/creds.json')
+        self.gs_client = self.context.sheets
+        self.cometa_client = self.context.cometa
+        # Последние успешно отправленные настройки (переживают перезапуск)
+        self.state = StateStore()
+        # Журнал батчей и очередь строк: недошедшее досылается через --resume, повторы пропускаются;
+        # устаревшие записи конвейер удаляет перед каждым запуском
+        self.journal = PushJournal()
+        # Артикулы, на которые Комета ответила «не найден»: не отправляются, пока не истечет срок
+        self.not_found = NotFoundCache()
+
         # Настраиваем файлы логов
-        self.setup_detailed_logging()
\ No newline at end of file
+        self.setup_detailed_logging()
+        self.pipeline = PushPipeline(self.context, state=self.state, journal=self.journal, not_found=self.not_found)
+
+    def setup_detailed_logging(self):
+        """Настройка записи логов в файлы"""
+        # Основной технический лог (app.log) - дозапись с ротацией, пишется фоновым потоком;
+        # excluded_rows.log перезаписывает конвейер одним блоком в конце каждого запуска
+        add_file_handler(log, 'app.log')
+
+    def run(self, delta: Optional[str] = None, df: Optional[pd.DataFrame] = None) -> Set[SettingsKey]:
+        """Читает лист и отправляет настройки в Комету.
+
+        delta — отправлять только автопилоты, чьи настройки изменились:
+        'state' сравнивает с последней успешной отправкой из StateStore,
+        'snapshot' — с текущими настройками из GET-запроса к Комете.
+        df — уже прочитанные строки листа (например, только измененные);
+        по умолчанию лист читается целиком.
+        Возвращает ключи (api_key_id, product_id) успешно отправленных строк.
+        """
+        return self.pipeline.run(delta=delta, df=df).sent_keys
+
+    def resume(self) -> Set[SettingsKey]:
+        """Досылает строки прошлых запусков, не получившие ответа сервера (очередь журнала)"""
+        return self.pipeline.resume().sent_keys
+
+    def close(self) -> None:
+        self.state.close()
+        self.journal.close()
+        self.not_found.close()
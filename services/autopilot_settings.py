@@ -1,8 +1,10 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 from typing import List, Optional
 
 # --- Модель данных ---
-@dataclass # Декоратор, который автоматически создает методы __init__, __repr__ и другие
+# Декоратор, который автоматически создает методы __init__, __repr__ и другие;
+# slots=True — без словаря атрибутов у каждого объекта: меньше памяти и быстрее доступ
+@dataclass(slots=True)
 class AutopilotSettings:
     # Обязательные поля
     api_key_id: int   # Уникальный ID вашего рекламного кабинета (целое число)
@@ -25,12 +27,19 @@ class AutopilotSettings:
 
     def to_api_dict(self) -> dict:
         """Метод для преобразования объекта класса в обычный словарь Python"""
-        
-        # asdict(self) — превращает наш красивый объект обратно в словарь {ключ: значение}
-        data = asdict(self)
-        
-        # Итерация (цикл) по словарю:
-        # Мы оставляем только те данные (k: v), где значение (v) НЕ равно None.
-        # Это критически важно: если мы отправим "active": None в API, 
+
+        # Поля читаются напрямую, без asdict: тот глубоко копирует вложенные списки,
+        # а они и так создаются заново для каждой строки листа.
+        # Мы оставляем только те данные, где значение НЕ равно None.
+        # Это критически важно: если мы отправим "active": None в API,
         # система может сбросить текущие настройки товара, а нам нужно только ОБНОВЛЯТЬ измененное.
-        return {k: v for k, v in data.items() if v is not None}
\ No newline at end of file
+        result = {}
+        for name in API_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = value
+        return result
+
+
+# Порядок полей в JSON — как в объявлении класса
+API_FIELDS = tuple(f.name for f in fields(AutopilotSettings))
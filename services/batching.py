@@ -0,0 +1,47 @@
+"""Адаптивный размер батча для отправки в Комету.
+
+Размер подстраивается по итогам каждого запроса: под целевое время ответа,
+под предел размера тела запроса и под долю неудачных ответов. Сбой сервера
+или сети уменьшает батч вдвое, успешные ответы плавно ведут его к цели.
+"""
+from typing import Optional
+
+
+class AdaptiveBatcher:
+    def __init__(self, max_size: int = 1000, min_size: int = 25, initial: Optional[int] = None,
+                 target_latency: float = 5.0, max_bytes: int = 2_000_000, smoothing: float = 0.3):
+        self.max_size = max_size
+        self.min_size = min_size
+        self.size = initial or max_size
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.smoothing = smoothing
+        # Сглаженная доля неудачных запросов (0..1)
+        self.failure_rate = 0.0
+
+    def _clamp(self, size: float) -> int:
+        return max(self.min_size, min(self.max_size, int(size)))
+
+    def next_size(self) -> int:
+        return self.size
+
+    def observe(self, size: int, ok: bool, elapsed: float, bytes_sent: int, row_error: bool = False) -> None:
+        """Учитывает результат запроса с батчем из size строк.
+
+        row_error — сервер отверг данные (400/422): это не признак перегрузки,
+        но при частых ошибках батч уменьшается, чтобы дешевле искать плохие строки.
+        """
+        self.failure_rate += self.smoothing * ((0.0 if ok else 1.0) - self.failure_rate)
+        if not ok and not row_error:
+            self.size = self._clamp(size // 2)
+            return
+        if ok and size:
+            target = self.max_size
+            if elapsed > 0:
+                target = min(target, self.target_latency * size / elapsed)
+            if bytes_sent > 0:
+                target = min(target, self.max_bytes * size / bytes_sent)
+            target *= 1 - self.failure_rate / 2
+            self.size = self._clamp(self.size + self.smoothing * (target - self.size))
+        else:
+            self.size = self._clamp(self.size * (1 - self.failure_rate / 2))
@@ -1,32 +1,412 @@
-import requests
-from typing import List, Optional
+import os
+import json
 import time
+import requests
+from collections import deque
+from dataclasses import dataclass, field
+from requests.adapters import HTTPAdapter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from cometa.services.batching import AdaptiveBatcher
+from cometa.services.json_stream import iter_json_array
 from cometa.services.logger import setup_logger
+from cometa.services.metrics import metrics
+from cometa.services.payload import encode_batch, gzip_enabled
+from cometa.services.push_journal import PushJournal, batch_hash
+from cometa.services.rate_limit import TokenBucket
+from cometa.services.retry import CircuitBreaker, RetryPolicy, parse_retry_after
 
 log = setup_logger()
 
+# Ответы, которые относятся к данным отдельных строк, а не ко всему запросу
+ROW_ERROR_CODES = (400, 422)
+
+
+@dataclass
+class BatchResult:
+    ok: bool
+    status_code: Optional[int] = None
+    elapsed: float = 0.0
+    bytes_sent: int = 0
+    attempts: int = 0
+    text: str = ''
+
+
+@dataclass
+class PushReport:
+    sent: int = 0
+    failed: int = 0
+    requests: int = 0
+    # Строки из батчей, уже принятых сервером в пределах окна дедупликации (не отправлялись)
+    duplicates: int = 0
+    # Строки, которые сервер отверг после изоляции: (payload, текст ошибки)
+    rejected: List[Tuple[dict, str]] = field(default_factory=list)
+
+    def merge(self, other: 'PushReport') -> None:
+        self.sent += other.sent
+        self.failed += other.failed
+        self.requests += other.requests
+        self.duplicates += other.duplicates
+        self.rejected.extend(other.rejected)
+
+    def summary(self) -> str:
+        return (
+            f"Отправлено: {self.sent}, не отправлено: {self.failed}, "
+            f"отклонено сервером: {len(self.rejected)}, повторов пропущено: {self.duplicates}, "
+            f"запросов: {self.requests}"
+        )
+
+
+@dataclass
+class _Lane:
+    """Очередь отправки одного юрлица со своим состоянием повторов"""
+    key: Any
+    payloads: List[dict]
+    batcher: AdaptiveBatcher
+    bucket: Optional[TokenBucket] = None
+    report: PushReport = field(default_factory=PushReport)
+    # Половинки после деления отправляются раньше новых батчей
+    pending: deque = field(default_factory=deque)
+    cursor: int = 0
+    running: int = 0
+
+    def next_batch(self) -> Optional[List[dict]]:
+        if self.pending:
+            return self.pending.popleft()
+        if self.cursor < len(self.payloads):
+            size = self.batcher.next_size()
+            batch = self.payloads[self.cursor:self.cursor + size]
+            self.cursor += size
+            return batch
+        return None
+
+    def drain(self) -> int:
+        """Снимает с очереди все неотправленные строки; возвращает их число"""
+        rest = sum(len(batch) for batch in self.pending) + max(0, len(self.payloads) - self.cursor)
+        self.pending.clear()
+        self.cursor = len(self.payloads)
+        return rest
+
+
+def not_found_article(text: str) -> Optional[int]:
+    """Артикул из ответа 400 вида {"detail": "...: 123456"}, если его удается извлечь"""
+    try:
+        return int(json.loads(text)['detail'].split(': ')[1])
+    except Exception:
+        return None
+
+
+def partition_by_entity(payloads: Iterable[dict]) -> Dict[Any, List[dict]]:
+    """Строки по api_key_id (юрлицам) в порядке первого появления"""
+    groups: Dict[Any, List[dict]] = {}
+    for payload in payloads:
+        groups.setdefault(payload.get('api_key_id'), []).append(payload)
+    return groups
+
+
+def retryable_request_error(error: Exception) -> bool:
+    """Сеть, таймаут, 429 или 5xx — стоит повторить; остальные ответы — нет"""
+    if isinstance(error, requests.HTTPError):
+        code = error.response.status_code if error.response is not None else None
+        return code is not None and (code == 429 or code >= 500)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
 # --- Клиент для API Кометы ---
 class CometaClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_workers: Optional[int] = None, bucket: Optional[TokenBucket] = None,
+                 retry: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None):
         self.url = 'https://api.e-comet.io/v1/autopilots'
         self.headers = {'Authorization': api_key, 'Content-Type': 'application/json'}
+        self.max_workers = max_workers or int(os.getenv('COMETA_MAX_WORKERS', 4))
+        # Общий бюджет запросов для всех потоков
+        self.bucket = bucket or TokenBucket()
+        # Повторы одного батча и предохранитель, общий для всех полос
+        self.retry = retry or RetryPolicy(
+            attempts=int(os.getenv('COMETA_RETRY_ATTEMPTS', 5)),
+            base=2.0,
+            deadline=float(os.getenv('COMETA_RETRY_DEADLINE', 120)),
+        )
+        self.breaker = breaker or CircuitBreaker('Комета')
+        # Сжатие тела POST (Content-Encoding: gzip), если API его принимает
+        self.gzip = gzip_enabled()
 
-    def send_batch(self, batch: List[dict]) -> bool:
-        for attempt in range(5):
+        # Одна сессия с пулом соединений: TLS-рукопожатие один раз, дальше keep-alive
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+
+    def post_batch(self, batch: List[dict], lane_bucket: Optional[TokenBucket] = None) -> BatchResult:
+        """Отправляет батч с повторами на 429, 5xx и сетевых ошибках.
+
+        Пауза растет экспоненциально со случайным разбросом, Retry-After
+        сервера соблюдается, время на батч ограничено retry.deadline.
+        lane_bucket — бюджет полосы (юрлица): паузы после 429 ложатся на него,
+        а общий бюджет клиента только ограничивает суммарную частоту.
+        Пока предохранитель разомкнут, батч сразу возвращается неотправленным.
+        """
+        data, encoding = encode_batch(batch, compress=self.gzip)
+        headers = {'Content-Encoding': encoding} if encoding else None
+        result = BatchResult(ok=False, bytes_sent=len(data))
+        backoff = lane_bucket or self.bucket
+        state = self.retry.begin()
+        while True:
+            if not self.breaker.allow():
+                metrics.add('circuit_rejected')
+                result.status_code = None
+                result.text = 'circuit open'
+                return result
+            waited = lane_bucket.acquire() if lane_bucket else 0.0
+            waited += self.bucket.acquire()
+            metrics.add('rate_limit_wait_seconds', waited)
+            result.attempts += 1
+            started = time.monotonic()
             try:
-                response = requests.post(self.url, headers=self.headers, json=batch, timeout=30)
-                if response.status_code == 200:
-                    log.info(f"✅ Батч успешно отправлен ({len(batch)} шт.)")
-                    return True
-                elif response.status_code == 429:
-                    wait = (attempt + 1) * 2
-                    log.warning(f"⚠️ 429 Too Many Requests. Ждем {wait} сек.")
-                    time.sleep(wait)
-                else:
-                    log.error(f"❌ Ошибка {response.status_code}: {response.text}")
-                    return False
+                response = self.session.post(self.url, data=data, headers=headers, timeout=30)
             except requests.RequestException as e:
+                result.elapsed = time.monotonic() - started
+                result.status_code = None
                 log.error(f"🌐 Ошибка сети: {e}")
-                time.sleep(2)
-        return False
\ No newline at end of file
+                metrics.add('network_errors')
+                self.breaker.failure()
+                wait = state.next_delay()
+                if wait is None:
+                    return result
+                state.sleep(wait)
+                continue
+
+            result.elapsed = time.monotonic() - started
+            result.status_code = response.status_code
+            metrics.observe('batch', result.elapsed)
+            metrics.add('http_requests')
+            metrics.add('bytes_sent', len(data))
+            metrics.add('bytes_received', len(response.content))
+            if response.status_code == 200:
+                self.breaker.success()
+                backoff.reward()
+                log.debug(f"✅ Батч успешно отправлен ({len(batch)} шт.)")
+                result.ok = True
+                return result
+
+            if response.status_code == 415 and encoding:
+                # API не принимает сжатое тело — дальше отправляем без gzip (не считается повтором)
+                log.warning("⚠️ 415 на gzip: отключаем сжатие запросов")
+                self.gzip = False
+                data, encoding = encode_batch(batch)
+                headers = None
+                result.bytes_sent = len(data)
+                continue
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if response.status_code == 429:
+                # Сервер жив, но просит сбавить темп: пауза и снижение частоты для всей полосы
+                self.breaker.success()
+                wait = state.next_delay(retry_after)
+                if wait is None:
+                    result.text = response.text
+                    return result
+                log.warning(f"⚠️ 429 Too Many Requests. Ждем {wait:.1f} сек.")
+                metrics.add('http_429')
+                metrics.add('http_429_backoff_seconds', wait)
+                backoff.penalize(wait)
+                continue
+            if response.status_code in (401, 403):
+                # Ключ не подходит — повторы ничего не дадут, останавливаем все полосы сразу
+                log.error(f"❌ Ошибка {response.status_code}: {response.text[:200]}")
+                self.breaker.trip(f"ошибка авторизации {response.status_code}")
+                result.text = response.text
+                return result
+            if response.status_code >= 500:
+                log.error(f"❌ Ошибка {response.status_code}: {response.text[:200]}")
+                self.breaker.failure()
+                wait = state.next_delay(retry_after)
+                if wait is None:
+                    result.text = response.text
+                    return result
+                state.sleep(wait)
+                continue
+            # Ошибка данных (400/422 и т.п.): сервер исправен, батч разбирается выше
+            self.breaker.success()
+            # Полный ответ — только на DEBUG: при массовых 400 он раздувает лог
+            log.error(f"❌ Ошибка {response.status_code}: {response.text[:200]}")
+            log.debug(f"Ответ сервера целиком: {response.text}")
+            result.text = response.text
+            return result
+
+    def send_batch(self, batch: List[dict]) -> bool:
+        return self.post_batch(batch).ok
+
+    def push(self, payloads: List[dict], batcher: Optional[AdaptiveBatcher] = None,
+             on_sent: Optional[Callable[[List[dict]], None]] = None,
+             journal: Optional[PushJournal] = None,
+             applied: Optional[Callable[[List[dict]], bool]] = None) -> PushReport:
+        """Отправляет все строки, нарезая батчи адаптивно.
+
+        Батч, отвергнутый из-за данных (400/422), не повторяется целиком:
+        если сервер назвал артикул — убирается только он, иначе батч делится
+        пополам, и плохие строки находятся за O(log n) запросов. on_sent
+        вызывается в основном потоке для каждого батча, получившего 200.
+        journal — журнал батчей: каждый батч записывается до отправки и
+        получает итоговый статус. applied(batch) — действуют ли эти настройки
+        на сервере сейчас (StateStore.holds): батч, уже принятый сервером по
+        журналу, пропускается, только если applied это подтверждает. Без
+        applied повторы не пропускаются: тот же батч может быть откатом к
+        прежним значениям после другой отправки.
+        """
+        lane = _Lane(key=None, payloads=payloads, batcher=batcher or AdaptiveBatcher())
+        self._run_lanes([lane], on_sent, journal, applied)
+        return lane.report
+
+    def push_partitioned(self, payloads: List[dict],
+                         on_sent: Optional[Callable[[List[dict]], None]] = None,
+                         journal: Optional[PushJournal] = None,
+                         applied: Optional[Callable[[List[dict]], bool]] = None) -> Dict[Any, PushReport]:
+        """Отправляет строки отдельными полосами по api_key_id (юрлицам).
+
+        У каждой полосы свой размер батча, свой бюджет и свои паузы после 429,
+        поэтому «шумное» юрлицо тормозит только себя. Потоки раздаются полосам
+        по кругу, общий TokenBucket клиента ограничивает суммарную частоту.
+        Возвращает отчет по каждому юрлицу.
+        """
+        return self.push_lanes(partition_by_entity(payloads), on_sent=on_sent, journal=journal, applied=applied)
+
+    def push_lanes(self, groups: Dict[Any, List[dict]],
+                   on_sent: Optional[Callable[[List[dict]], None]] = None,
+                   journal: Optional[PushJournal] = None,
+                   applied: Optional[Callable[[List[dict]], bool]] = None) -> Dict[Any, PushReport]:
+        """Отправляет уже разбитые по юрлицам строки: одна полоса на ключ groups"""
+        lanes = [self._lane(key, rows) for key, rows in groups.items()]
+        self._run_lanes(lanes, on_sent, journal, applied)
+        return {lane.key: lane.report for lane in lanes}
+
+    def _lane(self, key, payloads: List[dict]) -> '_Lane':
+        return _Lane(key=key, payloads=payloads, batcher=AdaptiveBatcher(),
+                     bucket=TokenBucket(rate=self.bucket.max_rate, capacity=self.bucket.capacity))
+
+    def _run_lanes(self, lanes: List['_Lane'], on_sent: Optional[Callable[[List[dict]], None]],
+                   journal: Optional[PushJournal] = None,
+                   applied: Optional[Callable[[List[dict]], bool]] = None) -> None:
+        if not lanes:
+            return
+        # Доля потоков на полосу: большая полоса не может занять весь пул
+        per_lane = max(1, self.max_workers // len(lanes))
+        turn = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='cometa') as pool:
+            running = {}
+
+            def refill():
+                nonlocal turn
+                if self.breaker.blocked():
+                    # API недоступен: оставшиеся строки не отправляем, их возьмет следующий запуск
+                    dropped = 0
+                    for lane in lanes:
+                        rest = lane.drain()
+                        lane.report.failed += rest
+                        dropped += rest
+                    if dropped:
+                        log.error(f"🔌 Предохранитель разомкнут, не отправлено строк: {dropped}")
+                    return
+                idle = 0
+                while len(running) < self.max_workers and idle < len(lanes):
+                    lane = lanes[turn % len(lanes)]
+                    turn += 1
+                    batch = lane.next_batch() if lane.running < per_lane else None
+                    if batch is None:
+                        idle += 1
+                        continue
+                    idle = 0
+                    digest = batch_hash(batch) if journal else None
+                    if journal:
+                        # Одного журнала мало: A, затем B, затем снова A — откат, его нужно отправить
+                        if applied and journal.seen(digest) and applied(batch):
+                            log.info(f"⏭️ Батч ({len(batch)} шт.) уже принят сервером, пропускаем")
+                            lane.report.duplicates += len(batch)
+                            journal.dequeue(batch)
+                            continue
+                        journal.begin(digest, batch, lane.key)
+                    lane.running += 1
+                    running[pool.submit(self.post_batch, batch, lane.bucket)] = (lane, batch, digest)
+
+            refill()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    lane, batch, digest = running.pop(future)
+                    lane.running -= 1
+                    result = future.result()
+                    row_error = result.status_code in ROW_ERROR_CODES
+                    lane.report.requests += result.attempts
+                    lane.batcher.observe(len(batch), result.ok, result.elapsed, result.bytes_sent, row_error)
+                    if result.ok:
+                        lane.report.sent += len(batch)
+                        status = 'sent'
+                        if on_sent:
+                            on_sent(batch)
+                    elif row_error:
+                        queued = len(lane.pending)
+                        self._isolate(batch, result, lane.pending, lane.report)
+                        parts = list(lane.pending)[:len(lane.pending) - queued]
+                        status = 'split' if parts else 'rejected'
+                        if journal:
+                            # Части записываются сразу: после падения их дошлет --resume
+                            for part in parts:
+                                journal.begin(batch_hash(part), part, lane.key)
+                    else:
+                        lane.report.failed += len(batch)
+                        status = 'failed'
+                    if journal:
+                        journal.finish(digest, status, result.status_code, result.attempts, result.text)
+                refill()
+
+    @staticmethod
+    def _isolate(batch: List[dict], result: BatchResult, pending: deque, report: PushReport) -> None:
+        """Отделяет строки, из-за которых сервер отверг батч"""
+        article = not_found_article(result.text)
+        rest = [item for item in batch if item.get('product_id') != article] if article else batch
+        if len(rest) < len(batch):
+            report.rejected.extend((item, result.text) for item in batch if item.get('product_id') == article)
+            if rest:
+                pending.appendleft(rest)
+        elif len(batch) == 1:
+            report.rejected.append((batch[0], result.text))
+        else:
+            middle = len(batch) // 2
+            pending.appendleft(batch[middle:])
+            pending.appendleft(batch[:middle])
+
+    def iter_autopilots(self, skip_statuses: Iterable[str] = ()) -> Iterator[dict]:
+        """Текущие настройки автопилотов (GET /v1/autopilots) потоком.
+
+        Ответ разбирается по мере скачивания: записи отдаются по одной, а
+        автопилоты со статусами из skip_statuses отбрасываются сразу после
+        разбора и не копятся в памяти.
+        """
+        skip = set(skip_statuses)
+        # Повторяется только установка соединения и заголовки ответа: оборванную выгрузку начинать заново нельзя
+        response = self.retry.call(self._open_stream, retryable=retryable_request_error,
+                                   retry_after=lambda e: parse_retry_after(getattr(e.response, 'headers', {}).get('Retry-After')),
+                                   breaker=self.breaker, name="GET /v1/autopilots")
+        with response:
+            for record in iter_json_array(self._counted(response.iter_content(chunk_size=64 * 1024))):
+                if record.get('status') not in skip:
+                    yield record
+
+    def _open_stream(self) -> requests.Response:
+        response = self.session.get(self.url, stream=True, timeout=(10, 120))
+        if response.status_code != 200:
+            response.close()
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _counted(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            metrics.add('bytes_received', len(chunk))
+            yield chunk
+
+    def get_autopilots(self) -> List[dict]:
+        """Текущие настройки всех автопилотов (GET /v1/autopilots)"""
+        return list(self.iter_autopilots())
@@ -0,0 +1,110 @@
+"""Общий контекст запуска: окружение и авторизованные клиенты.
+
+.env читается один раз на процесс. Клиенты создаются при первом обращении
+(вместе с импортом gspread/google-auth) и дальше переиспользуются. OAuth-токен
+сервисного аккаунта сохраняется на диск, и следующий запуск берет его, пока
+он не истек, вместо нового обмена JWT на токен.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from functools import cached_property
+from typing import Dict
+
+DEFAULT_TOKEN_DIR = '.sheet_cache'
+DEFAULT_SHEET_TITLE = "Панель управления продажами Вектор"
+
+_env_loaded = False
+_clients: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def load_env() -> None:
+    """load_dotenv() один раз на процесс"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def _token_path(creds_path: str, token_dir: str) -> str:
+    digest = hashlib.sha1(creds_path.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(token_dir, f"token_{digest}.json")
+
+
+def _restore_token(creds, path: str) -> None:
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, encoding='utf-8') as f:
+            cached = json.load(f)
+        creds.token = cached['token']
+        creds.expiry = datetime.fromisoformat(cached['expiry'])
+    except (OSError, ValueError, KeyError):
+        # Поврежденный кэш — просто получим новый токен
+        pass
+
+
+def _save_token(creds, path: str) -> None:
+    if not creds.token or not creds.expiry:
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    # Токен дает доступ к таблицам — файл доступен только владельцу
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'token': creds.token, 'expiry': creds.expiry.isoformat()}, f)
+    os.replace(tmp, path)
+
+
+def service_account(creds_path: str, token_dir: str = DEFAULT_TOKEN_DIR):
+    """gspread-клиент сервисного аккаунта, один на процесс для каждого файла ключа"""
+    path = os.path.abspath(creds_path)
+    with _lock:
+        if path not in _clients:
+            import gspread
+            from google.oauth2.service_account import Credentials
+
+            creds = Credentials.from_service_account_file(path, scopes=gspread.auth.DEFAULT_SCOPES)
+            token_file = _token_path(path, token_dir)
+            _restore_token(creds, token_file)
+
+            # google-auth обновляет токен сам, когда он истекает; после обновления сохраняем новый
+            refresh = creds.refresh
+
+            def refresh_and_save(request):
+                refresh(request)
+                _save_token(creds, token_file)
+
+            creds.refresh = refresh_and_save
+            _clients[path] = gspread.Client(auth=creds)
+        return _clients[path]
+
+
+class AppContext:
+    """Клиенты одного процесса: создаются при первом обращении и переиспользуются"""
+
+    def __init__(self, creds_path: str, sheet_title: str = DEFAULT_SHEET_TITLE):
+        load_env()
+        self.creds_path = creds_path
+        self.sheet_title = sheet_title
+
+    @cached_property
+    def gc(self):
+        return service_account(self.creds_path)
+
+    @cached_property
+    def sheets(self):
+        from cometa.services.google_sheet_client import GoogleSheetClient
+        return GoogleSheetClient(self.creds_path, self.sheet_title, gc=self.gc)
+
+    @cached_property
+    def cometa(self):
+        from cometa.services.cometa_client import CometaClient
+        api_key = os.getenv('COMETA_API_KEY')
+        if not api_key:
+            raise ValueError("Missing API Key")
+        return CometaClient(api_key)
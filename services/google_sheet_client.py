@@ -1,21 +1,173 @@
+import json
+import os
+from typing import Iterable, List, Optional
+
 import gspread
 import pandas as pd
+import requests
+from gspread.utils import rowcol_to_a1
+
+from cometa.services.context import service_account
 from cometa.services.logger import setup_logger
+from cometa.services.metrics import metrics
+from cometa.services.retry import CircuitBreaker, RetryPolicy, parse_retry_after
+from cometa.services.sheet_cache import drive_time, is_fresh, load, save
 
 log = setup_logger()
 
+DEFAULT_CACHE_DIR = '.sheet_cache'
+
+
+def _column_letter(index: int) -> str:
+    """Буква колонки по номеру (1 -> A)"""
+    return rowcol_to_a1(1, index)[:-1]
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, gspread.exceptions.APIError):
+        code = error.response.status_code
+        return code == 429 or code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, 'response', None)
+    return parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+
+
 # --- Клиент для Google Таблиц ---
 class GoogleSheetClient:
-    def __init__(self, creds_path: str, sheet_title: str):
-        self.gc = gspread.service_account(filename=creds_path)
+    def __init__(self, creds_path: str, sheet_title: str, cache_dir: str = DEFAULT_CACHE_DIR, gc=None):
+        # Клиент и токен общие для процесса; токен переживает перезапуск, пока не истек
+        self.gc = gc or service_account(creds_path)
         self.title = sheet_title
+        # Ключ таблицы и последнее прочитанное содержимое листов хранятся между запусками
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.keys_path = os.path.join(cache_dir, 'spreadsheet_keys.json')
+        self._key = None
+        # True, если последний get_data вернул кэш без скачивания листа
+        self.last_read_cached = False
+        # Квоты Google считаются поминутно: паузы до минуты, всего не дольше 5 минут на запрос
+        self.retry = RetryPolicy(attempts=6, base=2.0, max_delay=64.0, deadline=300.0)
+        self.breaker = CircuitBreaker('Google Таблицы')
+
+    def _retry(self, func):
+        """Повтор на 429, 5xx и сетевых ошибках с экспоненциальной паузой и предохранителем"""
+        return self.retry.call(func, retryable=_retryable, retry_after=_retry_after,
+                               breaker=self.breaker, name="Google Таблицы")
+
+    @property
+    def key(self) -> str:
+        """Ключ таблицы: поиск по названию в Drive выполняется один раз, дальше берется из кэша"""
+        if self._key:
+            return self._key
+        keys = {}
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, encoding='utf-8') as f:
+                keys = json.load(f)
+        if self.title not in keys:
+            keys[self.title] = self._retry(lambda: self.gc.open(self.title)).id
+            with open(self.keys_path, 'w', encoding='utf-8') as f:
+                json.dump(keys, f, ensure_ascii=False)
+        self._key = keys[self.title]
+        return self._key
 
-    def get_data(self, worksheet_name: str) -> pd.DataFrame:
+    def _forget_key(self) -> None:
+        """Таблица по сохраненному ключу не найдена (пересоздана) — ищем заново по названию"""
+        self._key = None
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, encoding='utf-8') as f:
+                keys = json.load(f)
+            keys.pop(self.title, None)
+            with open(self.keys_path, 'w', encoding='utf-8') as f:
+                json.dump(keys, f, ensure_ascii=False)
+
+    def open(self):
+        try:
+            return self._retry(lambda: self.gc.open_by_key(self.key))
+        except gspread.SpreadsheetNotFound:
+            self._forget_key()
+            return self._retry(lambda: self.gc.open_by_key(self.key))
+
+    def modified_time(self) -> str:
+        """Время последнего изменения таблицы (один легкий запрос к Drive API)"""
+        try:
+            metadata = self._retry(lambda: self.gc.http_client.get_file_drive_metadata(self.key))
+        except gspread.exceptions.APIError as e:
+            if e.response.status_code != 404:
+                raise
+            self._forget_key()
+            metadata = self._retry(lambda: self.gc.http_client.get_file_drive_metadata(self.key))
+        return metadata['modifiedTime']
+
+    @metrics.timed('sheets_read')
+    def get_data(self, worksheet_name: str, columns: Optional[Iterable[str]] = None,
+                 refresh: bool = False, revision: Optional[str] = None) -> pd.DataFrame:
+        """Лист как датафрейм строк.
+
+        columns — читать только эти колонки (по заголовкам): одним batchGet,
+        а если таблица не менялась с прошлого чтения, то без скачивания вовсе.
+        Свежесть кэша — та же, что у кэша записи (sheet_cache): запись листов
+        снимка продлевает и его, так что она не заставляет скачивать лист заново.
+        refresh — скачать колонки, даже если modifiedTime не сменился (он
+        отстает от правки на несколько секунд); кэш при этом обновляется.
+        revision — уже прочитанный modifiedTime, чтобы не запрашивать его повторно.
+        """
+        self.last_read_cached = False
         try:
-            spreadsheet = self.gc.open(self.title)
-            worksheet = spreadsheet.worksheet(worksheet_name)
-            data = worksheet.get_all_values()
-            return pd.DataFrame(data[1:], columns=data[0])
+            if columns is None:
+                data = self.open().worksheet(worksheet_name).get_all_values()
+                return pd.DataFrame(data[1:], columns=data[0])
+            return self._get_columns(worksheet_name, list(columns), refresh, revision)
         except Exception as e:
             log.error(f"Ошибка при чтении таблицы: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def _cache_paths(self, worksheet_name: str):
+        base = os.path.join(self.cache_dir, f"{self.key}_{worksheet_name}")
+        return base + '.json', base + '.pkl'
+
+    def _get_columns(self, worksheet_name: str, columns: List[str], refresh: bool = False,
+                     revision: Optional[str] = None) -> pd.DataFrame:
+        modified = revision or self.modified_time()
+        meta_path, frame_path = self._cache_paths(worksheet_name)
+        meta = load(meta_path)
+        if not refresh and is_fresh(meta, modified) and meta.get('columns') == columns and os.path.exists(frame_path):
+            self.last_read_cached = True
+            metrics.add('sheets_cache_hits')
+            log.info(f"Лист '{worksheet_name}' не менялся с {modified}, используем кэш")
+            return pd.read_pickle(frame_path)
+
+        header, df = self._read_columns(worksheet_name, columns, (meta or {}).get('header'))
+        df.to_pickle(frame_path)
+        save(meta_path, {'valid_until': drive_time(modified), 'columns': columns, 'header': header})
+        return df
+
+    def _read_columns(self, worksheet_name: str, columns: List[str], header: Optional[List[str]]):
+        """Заголовок и нужные колонки одним batchGet; если колонки сдвинулись — повтор по новому заголовку"""
+        sheet = "'" + worksheet_name.replace("'", "''") + "'"
+        for _ in range(2):
+            wanted = [name for name in columns if header and name in header]
+            ranges = [f"{sheet}!1:1"] + [
+                f"{sheet}!{_column_letter(header.index(name) + 1)}:{_column_letter(header.index(name) + 1)}"
+                for name in wanted
+            ]
+            response = self._retry(lambda: self.gc.http_client.values_batch_get(
+                self.key, ranges, params={'majorDimension': 'COLUMNS'}
+            ))
+            value_ranges = response.get('valueRanges', [])
+            actual = [col[0] if col else '' for col in value_ranges[0].get('values', [])]
+            if actual == header:
+                break
+            header = actual
+        else:
+            wanted, value_ranges = [], [{}]
+
+        data = [(vr.get('values') or [[]])[0] for vr in value_ranges[1:]]
+        height = max([len(col) for col in data] + [1]) - 1
+        df = pd.DataFrame({
+            name: col[1:] + [''] * (height - len(col) + 1)
+            for name, col in zip(wanted, data)
+        }, columns=wanted)
+        return header, df
@@ -0,0 +1,68 @@
+"""Потоковый разбор JSON-массива по мере скачивания.
+
+Ответ GET /v1/autopilots — один большой массив объектов. iter_json_array
+отдает элементы по одному, не дожидаясь конца загрузки и не держа в памяти
+ни весь текст ответа, ни весь список.
+"""
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    buffer = ''
+    pos = 0
+    started = False
+    chunks = iter(chunks)
+    exhausted = False
+
+    def more() -> bool:
+        """Дочитывает следующий кусок; False — поток закончился"""
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer = buffer[pos:] + text_decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        return True
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buffer):
+            if not more():
+                raise ValueError("JSON-массив оборвался до закрывающей скобки")
+            continue
+
+        char = buffer[pos]
+        if not started:
+            if char != '[':
+                raise ValueError(f"Ожидался JSON-массив, получено: {buffer[pos:pos + 50]!r}")
+            started = True
+            pos += 1
+        elif char == ']':
+            return
+        elif char == ',':
+            pos += 1
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Объект еще не докачан целиком — добираем данные и пробуем снова
+                if not more():
+                    raise
+                continue
+            if end == len(buffer) and not exhausted:
+                # Число на границе куска могло оборваться ("12" из "123") — дочитываем
+                more()
+                continue
+            pos = end
+            yield item
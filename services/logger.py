@@ -1,4 +1,12 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Tuple
+
 from colorlog import ColoredFormatter
 
 # --- Настройка логирования ---
@@ -6,8 +14,8 @@ def setup_logger():
     # Создаем или получаем логгер с именем "CometaApp" 
     logger = logging.getLogger("CometaApp")
     
-    # Устанавливаем минимальный уровень важности
-    logger.setLevel(logging.INFO)
+    # Устанавливаем минимальный уровень важности (COMETA_LOG_LEVEL=DEBUG — с полными ответами API)
+    logger.setLevel(os.getenv('COMETA_LOG_LEVEL', 'INFO').upper())
     
     # Настраиваем внешний вид строк 
     color_formatter = ColoredFormatter(
@@ -35,4 +43,76 @@ def setup_logger():
         logger.addHandler(console_handler)
     
     # Возвращаем полностью готовый объект логгера для использования в коде
-    return logger
\ No newline at end of file
+    return logger
+
+# --- Запись логов в файлы через фоновый поток ---
+# Одна очередь, один поток и один RotatingFileHandler на файл в процессе: логгеры,
+# пишущие в один файл, не мешают друг другу при ротации, а вызов log.info
+# в горячем цикле только кладет запись в очередь.
+LOG_MAX_BYTES = int(os.getenv('COMETA_LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.getenv('COMETA_LOG_BACKUPS', 5))
+
+_listeners: Dict[str, Tuple[QueueHandler, QueueListener]] = {}
+_listeners_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Строка JSON на запись; данные из extra={'data': {...}} попадают в поле data"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data = getattr(record, 'data', None)
+        if data is not None:
+            entry['data'] = data
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _file_formatter() -> logging.Formatter:
+    # COMETA_LOG_FORMAT=json — структурированные записи для разбора, иначе привычный текст
+    if os.getenv('COMETA_LOG_FORMAT', 'text') == 'json':
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+
+class _DataQueueHandler(QueueHandler):
+    """QueueHandler, который не теряет extra['data'] при подготовке записи к очереди"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        data = getattr(record, 'data', None)
+        record = super().prepare(record)
+        if data is not None:
+            record.data = data
+        return record
+
+
+def add_file_handler(logger: logging.Logger, path: str) -> None:
+    """Подключает к логгеру файл с ротацией; запись в файл идет в фоновом потоке"""
+    path = os.path.abspath(path)
+    with _listeners_lock:
+        if path not in _listeners:
+            file_handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                               encoding='utf-8', delay=True)
+            file_handler.setFormatter(_file_formatter())
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+            listener.start()
+            _listeners[path] = (_DataQueueHandler(log_queue), listener)
+        handler = _listeners[path][0]
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+
+
+@atexit.register
+def stop_file_handlers() -> None:
+    """Дописывает очереди в файлы (вызывается и автоматически при выходе)"""
+    with _listeners_lock:
+        for _, listener in _listeners.values():
+            listener.stop()
+        _listeners.clear()
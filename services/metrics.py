@@ -0,0 +1,127 @@
+"""Метрики запуска: длительность этапов, счетчики и задержки запросов.
+
+Один реестр на процесс (metrics). Этапы оборачиваются в metrics.stage(...),
+счетчики копятся через add(...), отдельные замеры (задержка батча) — через
+observe(...). В конце запуска write_report(job) сохраняет отчет в
+COMETA_METRICS_DIR (по умолчанию metrics/): <job>.json и <job>.prom в
+формате textfile для node_exporter.
+"""
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Квантиль по ближайшему рангу (без numpy: метрики не должны тянуть тяжелые импорты)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time.time()
+            self.stages: Dict[str, float] = defaultdict(float)
+            self.counters: Dict[str, float] = defaultdict(float)
+            self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Длительность этапа; повторные вызовы суммируются"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.stages[name] += elapsed
+
+    def timed(self, name: str):
+        """Декоратор: вся функция — этап name"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self.lock:
+            self.samples[name].append(value)
+
+    def report(self, job: str) -> dict:
+        with self.lock:
+            return {
+                'job': job,
+                'started_at': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'duration_seconds': round(time.time() - self.started, 3),
+                'stages_seconds': {name: round(value, 4) for name, value in self.stages.items()},
+                'counters': dict(self.counters),
+                'latency_seconds': {
+                    name: {
+                        'count': len(values),
+                        **{f"p{round(q * 100)}": round(percentile(values, q), 4) for q in QUANTILES},
+                        'max': round(max(values), 4) if values else 0.0,
+                    }
+                    for name, values in self.samples.items()
+                },
+            }
+
+    @staticmethod
+    def prometheus(report: dict) -> str:
+        job = report['job']
+        lines = [
+            '# TYPE cometa_run_duration_seconds gauge',
+            f'cometa_run_duration_seconds{{job="{job}"}} {report["duration_seconds"]}',
+            '# TYPE cometa_last_run_timestamp_seconds gauge',
+            f'cometa_last_run_timestamp_seconds{{job="{job}"}} {int(time.time())}',
+            '# TYPE cometa_stage_seconds gauge',
+        ]
+        lines += [f'cometa_stage_seconds{{job="{job}",stage="{name}"}} {value}'
+                  for name, value in report['stages_seconds'].items()]
+        lines.append('# TYPE cometa_counter gauge')
+        lines += [f'cometa_counter{{job="{job}",name="{name}"}} {value}'
+                  for name, value in report['counters'].items()]
+        lines.append('# TYPE cometa_latency_seconds summary')
+        for name, stats in report['latency_seconds'].items():
+            lines += [f'cometa_latency_seconds{{job="{job}",name="{name}",quantile="{q}"}} {stats[f"p{round(q * 100)}"]}'
+                      for q in QUANTILES]
+            lines.append(f'cometa_latency_seconds_count{{job="{job}",name="{name}"}} {stats["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, job: str, directory: Optional[str] = None) -> dict:
+        """Сохраняет отчет запуска в <dir>/<job>.json и <dir>/<job>.prom"""
+        directory = directory or os.getenv('COMETA_METRICS_DIR', 'metrics')
+        os.makedirs(directory, exist_ok=True)
+        report = self.report(job)
+        for name, content in ((f"{job}.json", json.dumps(report, ensure_ascii=False, indent=2)),
+                              (f"{job}.prom", self.prometheus(report))):
+            path = os.path.join(directory, name)
+            # Через временный файл: node_exporter не должен увидеть недописанный отчет
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+        return report
+
+
+metrics = Metrics()
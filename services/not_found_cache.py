@@ -0,0 +1,94 @@
+"""Кэш артикулов, которых нет в Комете.
+
+Когда сервер отвечает 400 «артикул не найден», пара (api_key_id, product_id)
+запоминается в той же SQLite-базе, что и StateStore. Следующие запуски
+отбрасывают такие строки до нарезки батчей и не платят за них запросами.
+Запись живет COMETA_NOT_FOUND_TTL секунд (по умолчанию неделя) с момента
+последнего отказа: если товар появится в Комете, строка снова уйдет после
+истечения срока. Содержимое кэша выгружается в CSV для чистки листа.
+"""
+import csv
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from cometa.services.settings_diff import SettingsKey
+from cometa.services.state_store import DEFAULT_STATE_PATH
+
+REPORT_COLUMNS = ['api_key_id', 'product_id', 'first_seen', 'last_seen', 'hits', 'detail']
+
+
+class NotFoundCache:
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.path = path or os.getenv('COMETA_STATE_DB', DEFAULT_STATE_PATH)
+        self.ttl = ttl if ttl is not None else float(os.getenv('COMETA_NOT_FOUND_TTL', 7 * 86400))
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS not_found_products (
+                api_key_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                detail TEXT,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (api_key_id, product_id)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+        self.prune()
+
+    def load(self) -> Set[SettingsKey]:
+        """Пары с неистекшим сроком"""
+        rows = self.conn.execute(
+            "SELECT api_key_id, product_id FROM not_found_products WHERE last_seen >= ?", (time.time() - self.ttl,)
+        )
+        return {(api_id, prod_id) for api_id, prod_id in rows}
+
+    def record(self, entries: Iterable[Tuple[SettingsKey, str]]) -> int:
+        """Запоминает отказы «не найден»: ((api_key_id, product_id), текст ответа)"""
+        now = time.time()
+        rows = [(*key, (detail or '')[:500], now, now) for key, detail in entries]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO not_found_products (api_key_id, product_id, detail, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (api_key_id, product_id) DO UPDATE SET
+                    detail = excluded.detail, last_seen = excluded.last_seen, hits = hits + 1
+            """, rows)
+        return len(rows)
+
+    def prune(self) -> int:
+        """Удаляет записи с истекшим сроком: эти артикулы снова будут отправлены"""
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM not_found_products WHERE last_seen < ?", (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def report(self) -> List[dict]:
+        rows = self.conn.execute(f"""
+            SELECT {', '.join(REPORT_COLUMNS)} FROM not_found_products
+            WHERE last_seen >= ? ORDER BY api_key_id, product_id
+        """, (time.time() - self.ttl,))
+        return [
+            {**dict(zip(REPORT_COLUMNS, row)),
+             'first_seen': datetime.fromtimestamp(row[2]).isoformat(timespec='seconds'),
+             'last_seen': datetime.fromtimestamp(row[3]).isoformat(timespec='seconds')}
+            for row in rows
+        ]
+
+    def write_report(self, path: str) -> int:
+        """CSV для менеджеров: какие артикулы убрать с листа; возвращает число строк"""
+        entries = self.report()
+        # utf-8-sig: Excel открывает кириллицу без настройки кодировки
+        with open(path + '.tmp', 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(entries)
+        os.replace(path + '.tmp', path)
+        return len(entries)
+
+    def close(self) -> None:
+        self.conn.close()
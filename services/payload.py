@@ -0,0 +1,29 @@
+"""Кодирование батча для POST /v1/autopilots.
+
+Весь батч сериализуется одним вызовом C-кодировщика json без пробелов
+между элементами и без \\uXXXX-экранирования кириллицы, сразу в байты.
+При включенном сжатии (COMETA_GZIP=1, если API принимает
+Content-Encoding: gzip) тело дополнительно сжимается gzip.
+"""
+import gzip
+import json
+import os
+from typing import List, Optional, Tuple
+
+# Маленькие батчи не сжимаем: заголовок gzip съест выигрыш
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), check_circular=False)
+
+
+def gzip_enabled() -> bool:
+    return os.getenv('COMETA_GZIP', '').strip().lower() in ('1', 'true', 'yes')
+
+
+def encode_batch(batch: List[dict], compress: bool = False) -> Tuple[bytes, Optional[str]]:
+    """Тело запроса и значение Content-Encoding (None — без сжатия)"""
+    data = _encoder.encode(batch).encode('utf-8')
+    if compress and len(data) >= GZIP_MIN_BYTES:
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+    return data, None
@@ -0,0 +1,332 @@
+"""Конвейер отправки настроек из листа в Комету.
+
+Этапы: read → parse → validate → merge → diff → batch → send → report. Каждый этап —
+отдельный метод, время которого попадает в отчет метрик под своим именем.
+Правила разбора и проверки передаются функциями (parse/validate), поэтому
+run.py и main/cometa_utils.py работают через один и тот же конвейер, а
+бенчмарк может подменить любой этап или вызвать его отдельно.
+"""
+import json
+import numbers
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import pandas as pd
+
+from cometa.services.cometa_client import PushReport, not_found_article, partition_by_entity
+from cometa.services.logger import setup_logger
+from cometa.services.metrics import metrics
+from cometa.services.not_found_cache import NotFoundCache
+from cometa.services.push_journal import PushJournal
+from cometa.services.settings_diff import SettingsKey, diff_against_hashes, diff_against_snapshot, settings_key
+from cometa.services.settings_merge import REASON_CONFLICT, REASON_MERGED, merge_duplicates
+from cometa.services.settings_parser import SHEET_COLUMNS, Exclusion, ParseResult, parse_settings
+from cometa.services.state_store import StateStore
+from cometa.services.validation import validate_settings
+
+log = setup_logger()
+
+SETTINGS_SHEET = "Настройки автопилота"
+EXCLUDED_LOG_PATH = 'excluded_rows.log'
+REJECTED_REPORT_PATH = 'rejected_rows.json'
+NOT_FOUND_REPORT_PATH = 'not_found_products.csv'
+REASON_NOT_FOUND = "Артикул не найден в Комете (кэш)"
+
+
+@dataclass
+class PipelineResult:
+    rows_read: int = 0
+    parsed: ParseResult = field(default_factory=ParseResult)
+    # Строки, ушедшие на этап отправки (после дельты)
+    payloads: List[dict] = field(default_factory=list)
+    unchanged: int = 0
+    # Строки, не прошедшие проверку перед отправкой
+    invalid: int = 0
+    # Строки, отброшенные по кэшу ненайденных артикулов (в invalid не входят)
+    known_not_found: int = 0
+    # Строки, слитые с нижней строкой того же ключа, и из них — с расхождением значений
+    merged: int = 0
+    conflicts: int = 0
+    reports: Dict[Any, PushReport] = field(default_factory=dict)
+    total: PushReport = field(default_factory=PushReport)
+    # Ключи (api_key_id, product_id) строк, принятых сервером
+    sent_keys: Set[SettingsKey] = field(default_factory=set)
+
+
+class PushPipeline:
+    def __init__(self, context, parse: Callable[[pd.DataFrame, str], ParseResult] = parse_settings,
+                 validate: Optional[Callable[[ParseResult], ParseResult]] = validate_settings,
+                 merge: Optional[Callable[[ParseResult], ParseResult]] = merge_duplicates,
+                 state: Optional[StateStore] = None, journal: Optional[PushJournal] = None,
+                 sheet: str = SETTINGS_SHEET, excluded_log_path: Optional[str] = EXCLUDED_LOG_PATH,
+                 rejected_report_path: Optional[str] = REJECTED_REPORT_PATH,
+                 not_found: Optional[NotFoundCache] = None,
+                 not_found_report_path: Optional[str] = NOT_FOUND_REPORT_PATH,
+                 logger=None, job: str = 'push'):
+        """context — источник клиентов (sheets, cometa), например AppContext.
+
+        state — последние отправленные настройки: нужен для delta='state' и
+        пополняется после каждого принятого батча. journal — журнал батчей
+        (досылка и пропуск повторов). validate=None — без проверки строк,
+        merge=None — без слияния повторов ключа (уйдут все, в порядке листа).
+        excluded_log_path / rejected_report_path = None — не писать текстовый
+        отчет об исключениях / его JSON-версию (поле, значение, причина).
+        not_found — кэш ненайденных артикулов: они отбрасываются до отправки,
+        новые отказы 400 «не найден» пополняют его, а содержимое выгружается
+        в not_found_report_path.
+        """
+        self.context = context
+        self.parse_rows = parse
+        self.validate_rows = validate
+        self.merge_rows = merge
+        self.state = state
+        self.journal = journal
+        self.sheet = sheet
+        self.excluded_log_path = excluded_log_path
+        self.rejected_report_path = rejected_report_path
+        self.not_found = not_found
+        self.not_found_report_path = not_found_report_path
+        self.log = logger or log
+        self.job = job
+
+    # --- Этапы ---
+
+    def read(self) -> pd.DataFrame:
+        return self.context.sheets.get_data(self.sheet, columns=list(SHEET_COLUMNS))
+
+    def parse(self, df: pd.DataFrame, today: str) -> ParseResult:
+        return self.parse_rows(df, today)
+
+    def validate(self, parsed: ParseResult) -> ParseResult:
+        if self.validate_rows:
+            parsed = self.validate_rows(parsed)
+        return self._drop_not_found(parsed) if self.not_found else parsed
+
+    def merge(self, parsed: ParseResult, result: PipelineResult) -> ParseResult:
+        """Одна запись на ключ (api_key_id, product_id): нижняя строка листа главнее"""
+        if not self.merge_rows:
+            return parsed
+        merged = self.merge_rows(parsed)
+        added = merged.exclusions[len(parsed.exclusions):]
+        result.merged = sum(1 for e in added if e.reason in (REASON_MERGED, REASON_CONFLICT))
+        result.conflicts = sum(1 for e in added if e.reason == REASON_CONFLICT)
+        # Слитые записи, не прошедшие повторную проверку
+        result.invalid += len(added) - result.merged
+        if result.conflicts:
+            keys = [[e.api_key_id, e.product_id] for e in added if e.reason == REASON_CONFLICT]
+            self.log.warning(f"Повторы ключа с разными значениями: {result.conflicts}, действуют нижние строки. "
+                             f"Подробности в: {self.excluded_log_path or 'отчете об исключениях'}",
+                             extra={'data': {'conflicts': keys[:100]}})
+        return merged
+
+    def diff(self, payloads: List[dict], delta: Optional[str], today: str, result: PipelineResult) -> List[dict]:
+        """delta='state' — относительно последней отправки, 'snapshot' — относительно GET Кометы"""
+        if delta == 'state':
+            diff = diff_against_hashes(payloads, self.state.load(), today)
+        elif delta == 'snapshot':
+            diff = diff_against_snapshot(payloads, self.context.cometa.get_autopilots(), today)
+        else:
+            return payloads
+        self.log.info(diff.summary())
+        result.unchanged = diff.unchanged
+        return diff.to_send
+
+    def batch(self, payloads: List[dict]) -> Dict[Any, List[dict]]:
+        """Очереди по юрлицам; размер батча подбирается при отправке по ответам API"""
+        return partition_by_entity(payloads)
+
+    def send(self, lanes: Dict[Any, List[dict]], result: PipelineResult) -> None:
+        """С журналом все строки сначала ставятся в очередь: что не получит ответа, дошлет --resume"""
+        if self.journal is not None:
+            self.journal.enqueue(payload for rows in lanes.values() for payload in rows)
+        result.reports = self.context.cometa.push_lanes(lanes, on_sent=self._on_sent(result), journal=self.journal,
+                                                        applied=self._applied())
+        if self.journal is not None:
+            # Отказ по данным повтором не исправить: такие строки досылать незачем
+            self.journal.dequeue(payload for report in result.reports.values() for payload, _ in report.rejected)
+
+    def report(self, result: PipelineResult) -> PipelineResult:
+        """Сводка по юрлицам, файл исключений и отчет метрик"""
+        for api_key_id, report in result.reports.items():
+            rejected = [payload.get('product_id') for payload, _ in report.rejected]
+            self.log.info(f"Юрлицо {api_key_id}: {report.summary()}",
+                          extra={'data': {'api_key_id': api_key_id, 'rejected': rejected}} if rejected else None)
+            for payload, detail in report.rejected:
+                self.log.debug(f"Отклонен product_id: {payload.get('product_id')}. {detail}")
+            result.total.merge(report)
+        self.log.info(f"Итого: {result.total.summary()}")
+
+        if self.not_found:
+            self._remember_not_found(result)
+
+        excluded = Counter(e.reason for e in result.parsed.exclusions)
+        if result.total.rejected:
+            excluded["Отклонено API"] += len(result.total.rejected)
+        self._write_exclusions(result)
+        if excluded:
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in excluded.most_common())
+            where = f". Подробности в: {self.excluded_log_path}" if self.excluded_log_path else ''
+            self.log.info(f"Исключено строк: {sum(excluded.values())} ({reasons}){where}",
+                          extra={'data': {'excluded': dict(excluded)}})
+
+        metrics.add('rows_read', result.rows_read)
+        metrics.add('rows_sent', result.total.sent)
+        metrics.add('rows_failed', result.total.failed)
+        metrics.add('rows_rejected', len(result.total.rejected))
+        metrics.add('rows_duplicate', result.total.duplicates)
+        metrics.add('rows_excluded', sum(excluded.values()))
+        metrics.add('rows_invalid', result.invalid)
+        metrics.add('rows_not_found_cached', result.known_not_found)
+        metrics.add('rows_merged', result.merged)
+        metrics.add('rows_conflict', result.conflicts)
+        metrics.write_report(self.job)
+        return result
+
+    # --- Запуски ---
+
+    def run(self, delta: Optional[str] = None, df: Optional[pd.DataFrame] = None) -> PipelineResult:
+        """Полный проход по листу (или по уже прочитанным строкам df)"""
+        metrics.reset()
+        self._prune_journal()
+        today = datetime.now().strftime("%Y-%m-%d")
+        result = PipelineResult()
+        if df is None:
+            with metrics.stage('read'):
+                df = self.read()
+        result.rows_read = len(df)
+        self.log.info(f"Прочитано строк из Google Таблицы: {len(df)}")
+
+        with metrics.stage('parse'):
+            parsed = self.parse(df, today)
+        with metrics.stage('validate'):
+            result.parsed = self.validate(parsed)
+        added = result.parsed.exclusions[len(parsed.exclusions):]
+        result.known_not_found = sum(1 for e in added if e.reason == REASON_NOT_FOUND)
+        result.invalid = len(added) - result.known_not_found
+        with metrics.stage('merge'):
+            result.parsed = self.merge(result.parsed, result)
+        with metrics.stage('diff'):
+            result.payloads = self.diff([item.to_api_dict() for item in result.parsed.settings], delta, today, result)
+        self.log.info(self._summary(result))
+
+        with metrics.stage('batch'):
+            lanes = self.batch(result.payloads)
+        with metrics.stage('send'):
+            self.send(lanes, result)
+        with metrics.stage('report'):
+            return self.report(result)
+
+    def resume(self) -> PipelineResult:
+        """Досылает строки прошлых запусков, не получившие ответа сервера (очередь журнала).
+
+        Это и батчи, оборванные падением, и строки, до которых отправка не
+        дошла: падение, разомкнутый предохранитель, исчерпанные повторы.
+        Строки незавершенных батчей, которые позже ушли в составе другого
+        батча, не досылаются: иначе старые значения перезаписали бы новые.
+        """
+        metrics.reset()
+        self._prune_journal()
+        result = PipelineResult()
+        pushed_at = self.state.pushed_at() if self.state is not None else {}
+        for entry in self.journal.incomplete():
+            started = datetime.fromtimestamp(entry.started_at).isoformat(timespec='seconds')
+            fresh = [p for p in entry.batch if pushed_at.get(settings_key(p), '') <= started]
+            # В очереди может лежать более новая версия того же ключа — она не заменяется
+            self.journal.enqueue(fresh, replace=False)
+            self.journal.finish(entry.batch_hash, 'requeued' if fresh else 'superseded')
+        result.payloads = self.journal.queued()
+        self.log.info(f"Строк к досылке: {len(result.payloads)}")
+
+        with metrics.stage('batch'):
+            lanes = self.batch(result.payloads)
+        with metrics.stage('send'):
+            self.send(lanes, result)
+        with metrics.stage('report'):
+            return self.report(result)
+
+    # --- Вспомогательное ---
+
+    def _on_sent(self, result: PipelineResult) -> Callable[[List[dict]], None]:
+        def on_sent(batch: List[dict]) -> None:
+            if self.state is not None:
+                self.state.record_batch(batch)
+            if self.journal is not None:
+                self.journal.dequeue(batch)
+            result.sent_keys.update(settings_key(payload) for payload in batch)
+        return on_sent
+
+    def _prune_journal(self) -> None:
+        """Перед каждым запуском: демон живет неделями, а журнал не должен расти без конца"""
+        if self.journal is not None:
+            removed = self.journal.prune()
+            if removed:
+                self.log.info(f"Из журнала батчей удалено устаревших записей: {removed}")
+
+    def _applied(self) -> Optional[Callable[[List[dict]], bool]]:
+        """Проверка «настройки уже действуют» для пропуска повторов из журнала; без state не пропускаем"""
+        return self.state.holds if self.state is not None else None
+
+    def _drop_not_found(self, parsed: ParseResult) -> ParseResult:
+        """Отбрасывает артикулы, которых, по кэшу, нет в Комете"""
+        known = self.not_found.load()
+        if not known:
+            return parsed
+        result = ParseResult(exclusions=list(parsed.exclusions))
+        rows = parsed.rows or [None] * len(parsed.settings)
+        for row_index, settings in zip(rows, parsed.settings):
+            if (settings.api_key_id, settings.product_id) in known:
+                result.exclusions.append(Exclusion(row_index, settings.product_id, REASON_NOT_FOUND,
+                                                   api_key_id=settings.api_key_id))
+            else:
+                result.settings.append(settings)
+                result.rows.append(row_index)
+        return result
+
+    def _remember_not_found(self, result: PipelineResult) -> None:
+        """Пополняет кэш отказами 400 «не найден» и выгружает его для чистки листа"""
+        entries = [
+            (settings_key(payload), detail) for payload, detail in result.total.rejected
+            if not_found_article(detail) == payload.get('product_id')
+        ]
+        if entries:
+            self.not_found.record(entries)
+        if self.not_found_report_path:
+            count = self.not_found.write_report(self.not_found_report_path)
+            if count:
+                self.log.info(f"Артикулов, не найденных в Комете: {count}. Список для чистки листа: {self.not_found_report_path}")
+        metrics.add('rows_not_found_new', len(entries))
+
+    def _summary(self, result: PipelineResult) -> str:
+        return (
+            f"\n--- РЕЗУЛЬТАТ ОБРАБОТКИ ---\n"
+            f"✅ К отправке: {len(result.payloads)}\n"
+            f"❌ Ошибки данных: {result.parsed.errors}\n"
+            f"⚠️ Пустые записи: {result.parsed.empty}\n"
+            f"🚫 Не прошли проверку: {result.invalid}\n"
+            f"🔎 Нет в Комете (по кэшу): {result.known_not_found}\n"
+            f"🔀 Слито повторов: {result.merged} (с расхождениями: {result.conflicts})\n"
+            f"⏭️ Без изменений: {result.unchanged}\n"
+            f"--------------------------"
+        )
+
+    def _write_exclusions(self, result: PipelineResult) -> None:
+        """Отчеты об исключенных строках пишутся одним блоком в конце запуска"""
+        if self.rejected_report_path:
+            entries = [asdict(e) for e in result.parsed.exclusions] + [
+                {'row_index': None, 'product_id': payload.get('product_id'), 'reason': "Отклонено API",
+                 'api_key_id': payload.get('api_key_id'), 'field': None, 'value': detail}
+                for payload, detail in result.total.rejected
+            ]
+            with open(self.rejected_report_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1, default=str)
+        if not self.excluded_log_path:
+            return
+        with open(self.excluded_log_path, 'w', encoding='utf-8') as f:
+            f.write(f"--- Отчет об исключенных артикулах от {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
+            f.writelines(f"Строка {int(e.row_index) + 2 if isinstance(e.row_index, numbers.Integral) else '?'}: Артикул [{e.product_id}] - Причина: {e.reason}"
+                         + (f" ({e.field}: {e.value})" if e.field else '') + "\n"
+                         for e in result.parsed.exclusions)
+            f.writelines(f"Отклонено API: Артикул [{payload.get('product_id')}] - Ответ: {detail}\n"
+                         for payload, detail in result.total.rejected)
@@ -0,0 +1,167 @@
+"""Журнал отправки батчей (write-ahead).
+
+Перед отправкой батч записывается в SQLite со статусом 'pending' и хэшем
+содержимого, после ответа — итоговый статус, код и начало текста ответа.
+Батч с тем же содержимым, уже принятый сервером в пределах окна, повторно
+не отправляется, если StateStore подтверждает, что эти настройки и сейчас
+последние.
+
+Батчи нарезаются по ходу отправки, поэтому в журнал попадают только уже
+начатые. Все строки запуска до отправки ставятся в очередь (push_queue, одна
+запись на ключ, новая заменяет старую) и снимаются с нее после ответа
+сервера. После падения, разомкнутого предохранителя или исчерпанных повторов
+в очереди остается ровно то, что не дошло, — его и досылает --resume.
+Незавершенные батчи и строки очереди старше COMETA_JOURNAL_MAX_AGE часов
+(по умолчанию сутки) удаляются: досылать такие старые настройки уже поздно.
+
+Статусы: pending — отправка начата, но итог не записан (процесс упал);
+sent — 200; failed — сеть, 5xx или исчерпаны повторы 429; split — сервер
+отверг данные, батч разделен на части (они в журнале отдельно);
+rejected — сервер отверг все строки батча;
+superseded — при досылке заменен батчем без устаревших строк;
+requeued — при досылке строки батча перенесены в очередь и уходят заново.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from cometa.services.settings_diff import settings_key
+from cometa.services.state_store import DEFAULT_STATE_PATH
+
+INCOMPLETE = ('pending', 'failed')
+
+
+def batch_hash(batch: List[dict]) -> str:
+    data = json.dumps(batch, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class JournalEntry:
+    batch_hash: str
+    api_key_id: Optional[int]
+    batch: List[dict]
+    status: str
+    started_at: float
+
+
+class PushJournal:
+    def __init__(self, path: Optional[str] = None, window: Optional[float] = None,
+                 max_age: Optional[float] = None):
+        self.path = path or os.getenv('COMETA_STATE_DB', DEFAULT_STATE_PATH)
+        # Окно дедупликации, сек.: одинаковый батч, принятый сервером за это время, не отправляется
+        self.window = window if window is not None else float(os.getenv('COMETA_DEDUP_WINDOW', 3600))
+        # Сколько часов незавершенный батч ждет досылки, прежде чем будет удален
+        self.max_age = max_age if max_age is not None else float(os.getenv('COMETA_JOURNAL_MAX_AGE', 24))
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS push_journal (
+                batch_hash TEXT PRIMARY KEY,
+                api_key_id INTEGER,
+                size INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                status_code INTEGER,
+                attempts INTEGER,
+                response TEXT,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS push_journal_status ON push_journal (status, started_at)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS push_queue (
+                api_key_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                queued_at REAL NOT NULL,
+                PRIMARY KEY (api_key_id, product_id)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def seen(self, digest: str) -> bool:
+        """Батч с таким содержимым уже принят сервером в пределах окна"""
+        row = self.conn.execute(
+            "SELECT 1 FROM push_journal WHERE batch_hash = ? AND status = 'sent' AND finished_at >= ?",
+            (digest, time.time() - self.window),
+        ).fetchone()
+        return row is not None
+
+    def begin(self, digest: str, batch: List[dict], api_key_id=None) -> None:
+        """Запись до отправки: после падения батч останется 'pending'"""
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO push_journal (batch_hash, api_key_id, size, payload, status, started_at)
+                VALUES (?, ?, ?, ?, 'pending', ?)
+                ON CONFLICT (batch_hash) DO UPDATE SET
+                    status = 'pending', started_at = excluded.started_at, finished_at = NULL
+            """, (digest, api_key_id, len(batch), json.dumps(batch, ensure_ascii=False), time.time()))
+
+    def finish(self, digest: str, status: str, status_code: Optional[int] = None,
+               attempts: Optional[int] = None, response: str = '') -> None:
+        with self.conn:
+            self.conn.execute("""
+                UPDATE push_journal
+                SET status = ?, status_code = ?, attempts = ?, response = ?, finished_at = ?
+                WHERE batch_hash = ?
+            """, (status, status_code, attempts, (response or '')[:500], time.time(), digest))
+
+    def incomplete(self) -> List[JournalEntry]:
+        """Незавершенные батчи в порядке отправки"""
+        rows = self.conn.execute(f"""
+            SELECT batch_hash, api_key_id, payload, status, started_at FROM push_journal
+            WHERE status IN ({','.join('?' * len(INCOMPLETE))}) ORDER BY started_at
+        """, INCOMPLETE)
+        return [JournalEntry(digest, api_key_id, json.loads(payload), status, started_at)
+                for digest, api_key_id, payload, status, started_at in rows]
+
+    def enqueue(self, payloads: Iterable[dict], replace: bool = True) -> None:
+        """Ставит строки в очередь до отправки; replace=False — не трогать уже стоящие (они новее)"""
+        now = time.time()
+        rows = [(*settings_key(p), json.dumps(p, sort_keys=True, ensure_ascii=False), now) for p in payloads]
+        conflict = "DO UPDATE SET payload = excluded.payload, queued_at = excluded.queued_at" if replace else "DO NOTHING"
+        with self.conn:
+            self.conn.executemany(f"""
+                INSERT INTO push_queue (api_key_id, product_id, payload, queued_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (api_key_id, product_id) {conflict}
+            """, rows)
+
+    def dequeue(self, payloads: Iterable[dict]) -> None:
+        """Снимает с очереди строки, на которые сервер ответил (200 или отказ по данным).
+
+        Строка снимается, только если в очереди лежат именно эти настройки:
+        более новая версия того же ключа остается ждать своей отправки.
+        """
+        rows = [(*settings_key(p), json.dumps(p, sort_keys=True, ensure_ascii=False)) for p in payloads]
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM push_queue WHERE api_key_id = ? AND product_id = ? AND payload = ?", rows
+            )
+
+    def queued(self) -> List[dict]:
+        """Строки, не получившие ответа сервера, в порядке постановки"""
+        rows = self.conn.execute("SELECT payload FROM push_queue ORDER BY queued_at, api_key_id, product_id")
+        return [json.loads(payload) for payload, in rows]
+
+    def prune(self, days: float = 7) -> int:
+        """Удаляет завершенные записи старше days дней, незавершенные и очередь — старше max_age часов"""
+        now = time.time()
+        stale = now - self.max_age * 3600
+        with self.conn:
+            cursor = self.conn.execute(f"""
+                DELETE FROM push_journal
+                WHERE started_at < CASE WHEN status IN ({','.join('?' * len(INCOMPLETE))}) THEN ? ELSE ? END
+            """, (*INCOMPLETE, stale, now - days * 86400))
+            removed = cursor.rowcount
+            cursor = self.conn.execute("DELETE FROM push_queue WHERE queued_at < ?", (stale,))
+        return removed + cursor.rowcount
+
+    def close(self) -> None:
+        self.conn.close()
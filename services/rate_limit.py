@@ -0,0 +1,55 @@
+"""Бюджет запросов к API Кометы.
+
+Token bucket с подстройкой скорости (AIMD): каждый 429 вдвое снижает
+разрешенную частоту и ставит паузу для всех потоков, каждый успешный
+ответ понемногу возвращает ее к настроенному потолку.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    def __init__(self, rate: Optional[float] = None, capacity: Optional[float] = None,
+                 min_rate: float = 0.1, recovery: float = 0.1):
+        # rate — запросов в секунду, capacity — допустимая пачка запросов подряд
+        self.max_rate = rate or float(os.getenv('COMETA_RATE_LIMIT', 2))
+        self.rate = self.max_rate
+        self.capacity = capacity or max(1.0, self.max_rate * 2)
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """Блокирует поток, пока не появится токен; возвращает время ожидания"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def penalize(self, wait: float) -> None:
+        """Ответ 429: снижаем частоту вдвое и приостанавливаем всех на wait секунд"""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + wait)
+
+    def reward(self) -> None:
+        """Успешный ответ: плавно возвращаем частоту к потолку"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery)
@@ -0,0 +1,186 @@
+"""Повторы с экспоненциальной паузой и автомат-предохранитель (circuit breaker).
+
+RetryPolicy задает число попыток, рост паузы и общий потолок времени на один
+запрос. Пауза — «полный джиттер»: случайное значение от 0 до base * factor^n,
+чтобы потоки и процессы не повторяли запросы синхронно. Если сервер прислал
+Retry-After, ждем ровно столько, сколько он просит (в пределах потолка).
+
+CircuitBreaker размыкается после threshold неудач подряд: пока он разомкнут,
+запросы не выполняются вовсе (ошибка сразу), через reset_timeout пропускается
+одна пробная попытка. Так лежащий API не съедает ни CPU, ни квоту.
+"""
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional, TypeVar
+
+from cometa.services.logger import setup_logger
+from cometa.services.metrics import metrics
+
+log = setup_logger()
+
+T = TypeVar('T')
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах: число секунд или HTTP-дата; нераспознанное — None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitOpenError(RuntimeError):
+    """Предохранитель разомкнут: запрос не выполнялся"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.threshold = threshold or int(os.getenv('COMETA_BREAKER_THRESHOLD', 5))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv('COMETA_BREAKER_RESET', 60))
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Можно ли выполнять запрос; после reset_timeout пропускает одну пробную попытку"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                log.info(f"🔌 {self.name}: пробный запрос после паузы")
+                return True
+            return False
+
+    def blocked(self) -> bool:
+        """Разомкнут и пауза еще не истекла (проверка без пробной попытки)"""
+        with self.lock:
+            return self.opened_at is not None and (
+                self.trial or time.monotonic() - self.opened_at < self.reset_timeout
+            )
+
+    def check(self) -> None:
+        if not self.allow():
+            metrics.add('circuit_rejected')
+            raise CircuitOpenError(f"{self.name}: предохранитель разомкнут, запрос не выполняется")
+
+    def success(self) -> None:
+        with self.lock:
+            if self.opened_at is not None:
+                log.info(f"🔌 {self.name}: сервис снова отвечает, предохранитель замкнут")
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.trial or (self.opened_at is None and self.failures >= self.threshold):
+                self._open(f"{self.failures} неудач подряд")
+
+    def trip(self, reason: str) -> None:
+        """Разомкнуть сразу (например, 401/403: повторять бессмысленно)"""
+        with self.lock:
+            self._open(reason)
+
+    def _open(self, reason: str) -> None:
+        if self.opened_at is None or self.trial:
+            log.error(f"🔌 {self.name}: {reason}, запросы приостановлены на {self.reset_timeout:.0f} сек.")
+            metrics.add('circuit_opened')
+        self.opened_at = time.monotonic()
+        self.trial = False
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 5
+    base: float = 1.0
+    factor: float = 2.0
+    max_delay: float = 60.0
+    # Потолок времени на один запрос со всеми повторами и паузами, сек.
+    deadline: float = 120.0
+
+    def begin(self) -> 'RetryState':
+        return RetryState(self)
+
+    def call(self, func: Callable[[], T], retryable: Callable[[Exception], bool],
+             retry_after: Optional[Callable[[Exception], Optional[float]]] = None,
+             breaker: Optional[CircuitBreaker] = None, name: str = 'Запрос') -> T:
+        """Вызывает func, повторяя его на исключениях, для которых retryable(e) истинно.
+
+        Неповторяемое исключение и исключение после исчерпания попыток или
+        времени пробрасываются как есть; при разомкнутом breaker — CircuitOpenError.
+        """
+        state = self.begin()
+        while True:
+            if breaker:
+                breaker.check()
+            try:
+                result = func()
+            except Exception as e:
+                if not retryable(e):
+                    # Сервис ответил (ошибка не из-за его состояния) — пробная попытка засчитывается
+                    if breaker:
+                        breaker.success()
+                    raise
+                if breaker:
+                    breaker.failure()
+                wait = state.next_delay(retry_after(e) if retry_after else None)
+                if wait is None:
+                    raise
+                log.warning(f"⚠️ {name}: {e.__class__.__name__} [попытка {state.attempt}/{self.attempts}], ждем {wait:.1f} сек.")
+                state.sleep(wait)
+                continue
+            if breaker:
+                breaker.success()
+            return result
+
+
+class RetryState:
+    """Счетчик попыток одного запроса"""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.attempt = 1
+        self.started = time.monotonic()
+
+    def next_delay(self, retry_after: Optional[float] = None) -> Optional[float]:
+        """Пауза перед следующей попыткой или None, если попытки или время исчерпаны"""
+        policy = self.policy
+        if self.attempt >= policy.attempts:
+            return None
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = random.uniform(0, min(policy.max_delay, policy.base * policy.factor ** (self.attempt - 1)))
+        if time.monotonic() - self.started + delay > policy.deadline:
+            return None
+        self.attempt += 1
+        metrics.add('retries')
+        return delay
+
+    @staticmethod
+    def sleep(delay: float) -> None:
+        metrics.add('retry_wait_seconds', delay)
+        time.sleep(delay)
@@ -1,4 +1,12 @@
-from autopilot_manager import AutopilotManager
+import sys
+from pathlib import Path
+
+if not __package__:
+    # Запуск скриптом (python services/run.py, cron): см. cometa_bootstrap
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import cometa_bootstrap  # noqa: F401
+
+from cometa.services.autopilot_manager import AutopilotManager
 
 def run_autopilot():
     manager = AutopilotManager()
@@ -6,4 +14,4 @@ def run_autopilot():
 
 
 if __name__ == "__main__":
-    run_autopilot()
\ No newline at end of file
+    run_autopilot()
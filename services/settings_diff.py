@@ -0,0 +1,130 @@
+"""Сравнение подготовленных настроек с уже примененными в Комете.
+
+Дельта-режим отправляет только новые и изменившиеся автопилоты. Состояние
+«до» берется либо из GET-снимка API, либо из хэшей последней успешной
+отправки (ключ — пара api_key_id, product_id).
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from cometa.services.settings_parser import to_iso_date
+
+SettingsKey = Tuple[int, int]
+
+KEY_FIELDS = ('api_key_id', 'product_id')
+
+# Поля-расписания: список {"date": ..., <значение>: ...}, действует запись с последней наступившей датой
+DATED_FIELDS = {'target_drr': 'drr', 'target_cost_override': 'cost', 'min_daily_cost': 'cost'}
+
+
+def settings_key(payload: dict) -> SettingsKey:
+    return int(payload['api_key_id']), int(payload['product_id'])
+
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def _schedule(entries, value_name: str, today: str):
+    """Расписание в сравнимом виде: действующее значение + будущие записи.
+
+    Дата прошлой записи не важна: [{"date": вчера, "cost": 500}] и
+    [{"date": сегодня, "cost": 500}] дают одинаковый результат в Комете.
+    """
+    if not isinstance(entries, list):
+        return entries
+    dated = []
+    for entry in entries:
+        date = to_iso_date(entry.get('date')) or today
+        dated.append((date, _number(entry.get(value_name))))
+    dated.sort(key=lambda e: e[0])
+    current = [value for date, value in dated if date <= today]
+    future = [[date, value] for date, value in dated if date > today]
+    return [current[-1] if current else None, future]
+
+
+def canonical_settings(payload: dict, today: Optional[str] = None) -> dict:
+    """Приводит настройки (из листа или из ответа API) к виду, пригодному для сравнения"""
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    result = {}
+    for name, value in payload.items():
+        if name in KEY_FIELDS:
+            continue
+        if name in DATED_FIELDS:
+            value = _schedule(value, DATED_FIELDS[name], today)
+        elif name == 'deposit_type':
+            value = sorted(value) if isinstance(value, list) else [value]
+        elif name == 'min_rem' and isinstance(value, list):
+            value = sorted([str(r.get('size')), _number(r.get('quantity'))] for r in value)
+        else:
+            value = _number(value)
+        result[name] = value
+    return result
+
+
+def settings_hash(payload: dict, today: Optional[str] = None) -> str:
+    """Короткий хэш канонического вида настроек"""
+    data = json.dumps(canonical_settings(payload, today), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class SettingsDiff:
+    to_send: List[dict] = field(default_factory=list)
+    added: int = 0
+    changed: int = 0
+    unchanged: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"Дельта: новых {self.added}, изменено {self.changed}, "
+            f"пропущено без изменений {self.unchanged}"
+        )
+
+
+def diff_against_hashes(payloads: Iterable[dict], known: Mapping[SettingsKey, str],
+                        today: Optional[str] = None) -> SettingsDiff:
+    """Сравнение с хэшами последней успешной отправки"""
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    diff = SettingsDiff()
+    for payload in payloads:
+        previous = known.get(settings_key(payload))
+        if previous is None:
+            diff.added += 1
+        elif previous != settings_hash(payload, today):
+            diff.changed += 1
+        else:
+            diff.unchanged += 1
+            continue
+        diff.to_send.append(payload)
+    return diff
+
+
+def diff_against_snapshot(payloads: Iterable[dict], records: Iterable[dict],
+                          today: Optional[str] = None) -> SettingsDiff:
+    """Сравнение с текущими настройками из GET /v1/autopilots.
+
+    Сравниваются только поля, которые мы отправляем: остальное в записи API
+    (статус, расход за день и т.п.) на решение не влияет.
+    """
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    current: Dict[SettingsKey, dict] = {settings_key(r): r for r in records}
+    diff = SettingsDiff()
+    for payload in payloads:
+        record = current.get(settings_key(payload))
+        if record is None:
+            diff.added += 1
+        else:
+            applied = {name: record.get(name) for name in payload}
+            if canonical_settings(payload, today) != canonical_settings(applied, today):
+                diff.changed += 1
+            else:
+                diff.unchanged += 1
+                continue
+        diff.to_send.append(payload)
+    return diff
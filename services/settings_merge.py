@@ -0,0 +1,98 @@
+"""Слияние строк листа с повторяющимся ключом (api_key_id, product_id).
+
+Правило старшинства — «побеждает последняя запись»: строки обходятся в
+порядке листа, и значение из более нижней строки заменяет значение из
+верхней. Пустые поля (None) ничего не заменяют, поэтому поля, которые
+заполнены только в одной из строк, объединяются без конфликта. Если обе
+строки задают одно поле по-разному, действует нижняя, а верхняя попадает
+в отчет как конфликт с обоими значениями.
+
+Строки индексируются словарем по ключу, проход один. Итоговая строка
+занимает место первого вхождения ключа, так что порядок отправки не
+зависит от того, где на листе стоят повторы.
+
+Две строки, каждая из которых прошла проверку, вместе могут ее не пройти,
+поэтому каждая слитая запись проверяется заново (check_settings) и при
+отказе не отправляется.
+"""
+import numbers
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from cometa.services.autopilot_settings import API_FIELDS, AutopilotSettings
+from cometa.services.settings_diff import KEY_FIELDS, SettingsKey
+from cometa.services.settings_parser import Exclusion, ParseResult
+from cometa.services.validation import Problem, check_settings
+
+REASON_MERGED = "Повтор ключа: объединена с нижней строкой"
+REASON_CONFLICT = "Повтор ключа с другими значениями: действует нижняя строка"
+
+MERGE_FIELDS = tuple(name for name in API_FIELDS if name not in KEY_FIELDS)
+
+
+def _sheet_row(row_index: Any) -> Any:
+    """Номер строки в таблице: индекс данных + заголовок + счет с единицы"""
+    return int(row_index) + 2 if isinstance(row_index, numbers.Integral) else row_index
+
+
+def merge_duplicates(parsed: ParseResult,
+                     check: Optional[Callable[[AutopilotSettings], Optional[Problem]]] = check_settings) -> ParseResult:
+    """Одна запись на ключ; поглощенные строки добавляются к exclusions.
+
+    У отчета по поглощенной строке value — номер строки, в которую она
+    влилась ('row'), и для конфликтов пары [было, стало] по каждому полю;
+    field — список полей с расхождениями (или product_id, если их нет).
+    Слитая запись, не прошедшая check, исключается с причиной проверки
+    (строка отчета — нижняя из слитых); check=None — без повторной проверки.
+    """
+    rows = parsed.rows or [None] * len(parsed.settings)
+    result = ParseResult(exclusions=list(parsed.exclusions))
+    index: Dict[SettingsKey, int] = {}
+    # Позиции, где лежит уже скопированная запись: исходные объекты разбора не меняются
+    copied: Set[int] = set()
+    for row_index, settings in zip(rows, parsed.settings):
+        key = (settings.api_key_id, settings.product_id)
+        pos = index.get(key)
+        if pos is None:
+            index[key] = len(result.settings)
+            result.settings.append(settings)
+            result.rows.append(row_index)
+            continue
+
+        if pos not in copied:
+            result.settings[pos] = replace(result.settings[pos])
+            copied.add(pos)
+        kept = result.settings[pos]
+        conflicts: Dict[str, List[Any]] = {}
+        for name in MERGE_FIELDS:
+            new = getattr(settings, name)
+            if new is None:
+                continue
+            old = getattr(kept, name)
+            if old is not None and old != new:
+                conflicts[name] = [old, new]
+            setattr(kept, name, new)
+
+        result.exclusions.append(Exclusion(
+            result.rows[pos], settings.product_id, REASON_CONFLICT if conflicts else REASON_MERGED,
+            api_key_id=settings.api_key_id, field=', '.join(conflicts) if conflicts else 'product_id',
+            value={'row': _sheet_row(row_index), **conflicts},
+        ))
+        result.rows[pos] = row_index
+
+    if check is None:
+        return result
+    rejected = set()
+    for pos in sorted(copied):
+        problem = check(result.settings[pos])
+        if problem:
+            field_name, value, reason = problem
+            settings = result.settings[pos]
+            result.exclusions.append(Exclusion(result.rows[pos], settings.product_id, reason,
+                                               api_key_id=settings.api_key_id, field=field_name, value=value))
+            rejected.add(pos)
+    if rejected:
+        kept = [pos for pos in range(len(result.settings)) if pos not in rejected]
+        result.settings = [result.settings[pos] for pos in kept]
+        result.rows = [result.rows[pos] for pos in kept]
+    return result
@@ -0,0 +1,295 @@
+"""Колоночный парсер листа «Настройки автопилота».
+
+Заменяет построчные циклы df.iterrows() из run.py и main/cometa_utils.py:
+столбцы конвертируются целиком средствами pandas/NumPy, а Python-объекты
+создаются один раз на последнем шаге.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from cometa.services.autopilot_settings import AutopilotSettings
+
+# Соответствие заголовков листа и полей API
+SHEET_COLUMNS = {
+    'Идентификатор юрлица': 'api_key_id',
+    'Артикул': 'product_id',
+    'Активность': 'active',
+    'Дата, начиная с которой будет действовать целевой ДРР': 'target_drr_date',
+    'Целевой ДРР': 'target_drr',
+    'Дата, начиная с которой будет действовать целевой расход': 'target_cost_date',
+    'Целевой расход': 'target_cost_override',
+    'Размер': 'size',
+    'Количество': 'quantity',
+    'Счет автопополнения': 'deposit_type',
+    'Дата минимального расхода': 'min_daily_cost_date',
+    'Минимальный расход': 'min_daily_cost',
+    'Максимальный расход': 'max_daily_cost',
+}
+# Заголовки колонок ключа (api_key_id, product_id)
+SHEET_KEY_COLUMNS = ['Идентификатор юрлица', 'Артикул']
+
+DEPOSIT_TYPES = ['account', 'net', 'bonus']
+
+REASON_INVALID = "Ошибка формата данных или отсутствуют ID"
+REASON_EMPTY = "Нет данных для обновления (все поля пустые)"
+
+# Виды значений ячейки при разборе чисел
+_EMPTY, _ERROR = 1, 2
+
+
+@dataclass
+class Exclusion:
+    """Строка листа, не попавшая в отправку"""
+    row_index: Any
+    product_id: Any
+    reason: str
+    # Для отказов проверки: юрлицо, поле и значение, из-за которых строка отклонена
+    api_key_id: Any = None
+    field: Optional[str] = None
+    value: Any = None
+
+
+@dataclass
+class ParseResult:
+    settings: List[AutopilotSettings] = field(default_factory=list)
+    exclusions: List[Exclusion] = field(default_factory=list)
+    # Индексы строк листа, из которых получены settings (параллельно settings)
+    rows: List[Any] = field(default_factory=list)
+
+    @property
+    def errors(self) -> int:
+        return sum(1 for e in self.exclusions if e.reason == REASON_INVALID)
+
+    @property
+    def empty(self) -> int:
+        return sum(1 for e in self.exclusions if e.reason == REASON_EMPTY)
+
+
+def _as_str(df: pd.DataFrame, column: str) -> pd.Series:
+    """Столбец как str(val); отсутствующий столбец ведет себя как row.get() -> 'None'"""
+    if column in df.columns:
+        return df[column].astype(str)
+    return pd.Series('None', index=df.index, dtype=object)
+
+
+def _map_unique(values: pd.Series, func: Callable[[Any], Any]) -> np.ndarray:
+    """Применяет func к каждому уникальному значению столбца и раскладывает результат по строкам.
+
+    На листе уникальных значений в столбце единицы (даты, флаги, расходы),
+    поэтому Python-код выполняется один раз на значение, а не на строку.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.empty(len(uniques), dtype=object)
+    mapped[:] = [func(u) for u in uniques]
+    return mapped[codes]
+
+
+def _parse_numbers(values: pd.Series, clean: Callable[[str], str]):
+    """Векторный аналог float(clean(v)) с правилами пустых значений run.py.
+
+    Возвращает (числа float64, маска пустых, маска ошибок). Пустыми считаются
+    '' и 'nan' в любом регистре, ошибкой — значение, на котором float() падает.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    numbers = np.full(len(uniques), np.nan)
+    kinds = np.zeros(len(uniques), dtype=np.int8)
+    for i, raw in enumerate(uniques):
+        v = clean(raw)
+        if not v or v.lower() == 'nan':
+            kinds[i] = _EMPTY
+            continue
+        try:
+            numbers[i] = float(v)
+        except ValueError:
+            kinds[i] = _ERROR
+    kinds = kinds[codes]
+    return numbers[codes], kinds == _EMPTY, kinds == _ERROR
+
+
+def _clean_int(v: str) -> str:
+    return v.strip().replace('\xa0', '')
+
+
+def _clean_float(v: str) -> str:
+    return v.strip().replace(',', '.').replace('\xa0', '')
+
+
+def _to_bool(v: str) -> Optional[bool]:
+    v = v.strip()
+    return True if v == '1' else (False if v == '0' else None)
+
+
+def _ints(numbers: np.ndarray) -> List[int]:
+    return [int(x) for x in numbers]
+
+
+def parse_settings(df: pd.DataFrame, today: Optional[str] = None) -> ParseResult:
+    """Разбирает лист в AutopilotSettings по правилам AutopilotManager.
+
+    Строки с ошибкой формата или без ID, а также строки без единой настройки
+    попадают в exclusions с той же причиной, что писал построчный парсер.
+    """
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    result = ParseResult()
+    if df.empty:
+        return result
+
+    prod, prod_empty, prod_err = _parse_numbers(_as_str(df, 'Артикул'), _clean_int)
+    api, api_empty, api_err = _parse_numbers(_as_str(df, 'Идентификатор юрлица'), _clean_int)
+    min_c, min_empty, min_err = _parse_numbers(_as_str(df, 'Минимальный расход'), _clean_float)
+    max_c, max_empty, max_err = _parse_numbers(_as_str(df, 'Максимальный расход'), _clean_int)
+    drr, drr_empty, drr_err = _parse_numbers(_as_str(df, 'Целевой ДРР'), _clean_float)
+
+    with np.errstate(invalid='ignore'):
+        prod, api, min_c, max_c = np.trunc(prod), np.trunc(api), np.trunc(min_c), np.trunc(max_c)
+
+    # int(float(v)) падает на nan/inf — такие строки построчный парсер отбрасывал целиком
+    invalid = (
+        prod_err | api_err | min_err | max_err | drr_err
+        | (~prod_empty & ~np.isfinite(prod)) | (~api_empty & ~np.isfinite(api))
+        | (~min_empty & ~np.isfinite(min_c)) | (~max_empty & ~np.isfinite(max_c))
+        | prod_empty | api_empty | (prod == 0) | (api == 0)
+    )
+
+    active = _map_unique(_as_str(df, 'Активность'), _to_bool)
+    drr_date = _map_unique(
+        _as_str(df, 'Дата, начиная с которой будет действовать целевой ДРР'),
+        lambda v: v.strip() if v.strip() and v.strip() != 'nan' else today,
+    )
+
+    empty = ~invalid & pd.isna(active) & min_empty & max_empty & drr_empty
+
+    raw_prod = df['Артикул'].to_numpy() if 'Артикул' in df.columns else None
+    labels = df.index
+    for pos in np.flatnonzero(invalid | empty):
+        if invalid[pos]:
+            raw = raw_prod[pos] if raw_prod is not None else 'Неизвестно'
+            result.exclusions.append(Exclusion(labels[pos], raw, REASON_INVALID))
+        else:
+            result.exclusions.append(Exclusion(labels[pos], int(prod[pos]), REASON_EMPTY))
+
+    keep = np.flatnonzero(~invalid & ~empty)
+    result.rows = labels[keep].tolist()
+    rows = zip(
+        _ints(api[keep]), _ints(prod[keep]), active[keep].tolist(),
+        min_c[keep].tolist(), min_empty[keep].tolist(),
+        max_c[keep].tolist(), max_empty[keep].tolist(),
+        drr[keep].tolist(), drr_empty[keep].tolist(), drr_date[keep].tolist(),
+    )
+    for api_id, prod_id, is_active, min_v, no_min, max_v, no_max, drr_v, no_drr, drr_d in rows:
+        result.settings.append(AutopilotSettings(
+            api_key_id=api_id,
+            product_id=prod_id,
+            active=is_active,
+            target_drr=None if no_drr else [{"date": drr_d, "drr": drr_v}],
+            min_daily_cost=None if no_min else [{"date": today, "cost": int(min_v)}],
+            max_daily_cost=None if no_max else int(max_v),
+        ))
+    return result
+
+
+# --- Правила cometa_utils.main ---
+
+def to_iso_date(date_str):
+    """Дата листа (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ) в ISO; нераспознанная — None"""
+    if not date_str or pd.isna(date_str):
+        return None
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        try:
+            return datetime.strptime(date_str, "%d.%m.%Y").strftime("%Y-%m-%d")
+        except ValueError:
+            return None
+
+
+def _to_int_or_none(x: str):
+    x = x.strip()
+    return int(x) if x and x != 'nan' else None
+
+
+def _to_float_or_none(x: str):
+    x = x.replace(',', '.').strip()
+    return float(x) if x and x != 'nan' else None
+
+
+def build_params(df: pd.DataFrame, today: Optional[str] = None) -> List[dict]:
+    """Собирает словари параметров по правилам cometa_utils.main (с очисткой полей).
+
+    Списочные поля заполняются только для строк, где исходные ячейки не NaN;
+    неразбираемое число, как и раньше, поднимает ValueError.
+    """
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    df = df.rename(columns=SHEET_COLUMNS)
+    n = len(df)
+    if n == 0:
+        return []
+
+    def strs(column):
+        return df[column].astype(str)
+
+    def pair(value_col, other_col):
+        return (df[value_col].notna() & df[other_col].notna()).to_numpy()
+
+    # Неразбираемое число поднимает ValueError прямо из int()/float(), как раньше
+    api = _map_unique(strs('api_key_id'), _to_int_or_none)
+    prod = _map_unique(strs('product_id'), _to_int_or_none)
+    active = _map_unique(strs('active'), _to_bool)
+    max_c = _map_unique(strs('max_daily_cost'), _to_int_or_none)
+    min_c = _map_unique(strs('min_daily_cost'), _to_float_or_none)
+
+    def dated(value_col, date_col):
+        """Пары (дата, значение) для списков вида [{"date": ..., <поле>: ...}]"""
+        mask = pair(value_col, date_col)
+        dates = np.full(n, None, dtype=object)
+        vals = np.full(n, None, dtype=object)
+        if mask.any():
+            dates[mask] = _map_unique(df[date_col][mask], to_iso_date)
+            vals[mask] = _map_unique(strs(value_col)[mask], _to_float_or_none)
+        return mask & (dates != None) & (dates != '') & (vals != None), dates, vals  # noqa: E711
+
+    drr_ok, drr_dates, drr_vals = dated('target_drr', 'target_drr_date')
+    cost_ok, cost_dates, cost_vals = dated('target_cost_override', 'target_cost_date')
+
+    rem_mask = pair('quantity', 'size')
+    quantity = np.full(n, None, dtype=object)
+    if rem_mask.any():
+        quantity[rem_mask] = _map_unique(strs('quantity')[rem_mask], _to_int_or_none)
+    sizes = strs('size').to_numpy()
+
+    deposit = df['deposit_type'].to_numpy()
+    deposit_ok = df['deposit_type'].notna().to_numpy() & df['deposit_type'].isin(DEPOSIT_TYPES).to_numpy()
+
+    params = []
+    for i in range(n):
+        params.append({
+            "api_key_id": api[i],
+            "product_id": prod[i],
+            "active": active[i],
+            "target_drr": [{"date": drr_dates[i], "drr": drr_vals[i]}] if drr_ok[i] else None,
+            "target_cost_override": (
+                [{"date": cost_dates[i], "cost": cost_vals[i]}] if cost_ok[i] else None
+            ),
+            "min_rem": (
+                [{"quantity": quantity[i], "size": sizes[i]}]
+                if rem_mask[i] and quantity[i] is not None else None
+            ),
+            "deposit_type": [deposit[i]] if deposit_ok[i] else None,
+            "min_daily_cost": [{"date": today, "cost": min_c[i]}] if min_c[i] is not None else None,
+            "max_daily_cost": max_c[i],
+        })
+    return params
+
+
+def parse_params(df: pd.DataFrame, today: Optional[str] = None) -> ParseResult:
+    """Правила cometa_utils.main в виде ParseResult для общего конвейера отправки.
+
+    Строки не исключаются (как и раньше, уходят все), но пустые поля больше
+    не передаются как null: to_api_dict отбрасывает None, как в run.py.
+    """
+    return ParseResult(settings=[AutopilotSettings(**params) for params in build_params(df, today)],
+                       rows=df.index.tolist())
@@ -0,0 +1,57 @@
+"""Свежесть локальных кэшей листов по времени изменения таблицы.
+
+Drive отдает modifiedTime всей таблицы, а не листа, и обновляет его с
+задержкой в несколько секунд после записи. Поэтому кэш хранит не само
+modifiedTime, а границу valid_until (секунды эпохи): пока modifiedTime
+таблицы не позже нее, содержимое кэша совпадает с листом.
+
+После собственной записи граница — момент окончания записи плюс
+COMETA_SHEET_WRITE_GRACE секунд (по умолчанию 5): запоздавшее обновление
+modifiedTime от нашей же записи не считается чужой правкой. Правка,
+сделанная в эти же секунды, будет замечена при следующем изменении таблицы.
+Кэши других листов той же таблицы, верные до записи, переносятся на ту же
+границу (carry_forward): запись одного листа их не трогала.
+"""
+import glob
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+OWN_WRITE_GRACE = float(os.getenv('COMETA_SHEET_WRITE_GRACE', 5))
+
+
+def drive_time(value: str) -> float:
+    """modifiedTime Drive ('2026-10-18T15:04:23.123Z') в секундах эпохи"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def load(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Кэш старого формата без границы свежести не проверить — как его отсутствие
+    return cache if isinstance(cache, dict) and 'valid_until' in cache else None
+
+
+def save(path: str, cache: dict) -> None:
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def is_fresh(cache: Optional[dict], modified: str) -> bool:
+    return cache is not None and drive_time(modified) <= cache['valid_until']
+
+
+def carry_forward(cache_dir: str, spreadsheet_id: str, modified: str, valid_until: float,
+                  skip: Optional[str] = None) -> None:
+    """Переносит на valid_until кэши листов таблицы, свежие при modifiedTime = modified"""
+    for path in glob.glob(os.path.join(cache_dir, f"{spreadsheet_id}_*.json")):
+        if path == skip:
+            continue
+        cache = load(path)
+        if is_fresh(cache, modified) and cache['valid_until'] < valid_until:
+            save(path, {**cache, 'valid_until': valid_until})
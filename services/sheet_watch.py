@@ -0,0 +1,102 @@
+"""Отслеживание правок на листе настроек.
+
+SheetWatcher дешево проверяет ревизию таблицы (modifiedTime из Drive) и,
+если она сменилась, читает нужные колонки и отдает только строки, которых
+не было в прошлом чтении (сравнение по хэшу содержимого строки, поэтому
+вставка и удаление строк не делают «измененными» все строки ниже).
+К измененной строке добавляются все строки листа с тем же ключом: иначе
+слияние повторов (settings_merge, «побеждает нижняя строка») увидело бы
+только отредактированную строку, и правка верхней перебила бы нижнюю.
+
+Вместо опроса можно будить демон вебхуком: триггер Apps Script на
+редактирование отправляет POST на локальный порт, например
+
+    function onEditTrigger(e) {
+      UrlFetchApp.fetch('http://<host>:<port>/edit', {
+        method: 'post', headers: {'X-Cometa-Token': '<COMETA_WEBHOOK_TOKEN>'}
+      });
+    }
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Sequence
+
+import pandas as pd
+
+from cometa.services.logger import setup_logger
+
+log = setup_logger()
+
+
+def with_key_groups(df: pd.DataFrame, edited: pd.DataFrame, key_columns: Sequence[str]) -> pd.DataFrame:
+    """Строки df, чей ключ совпадает с ключом хотя бы одной строки edited, в порядке листа"""
+    if edited.empty or not all(col in df.columns for col in key_columns):
+        return edited
+
+    def keys(frame: pd.DataFrame) -> pd.MultiIndex:
+        # '5', ' 5' и '5.0' — один и тот же ключ, как после разбора листа
+        return pd.MultiIndex.from_arrays(
+            [pd.to_numeric(frame[col].astype(str).str.strip(), errors='coerce') for col in key_columns]
+        )
+
+    return df[keys(df).isin(keys(edited)) | df.index.isin(edited.index)]
+
+
+class SheetWatcher:
+    def __init__(self, sheets, worksheet_name: str, columns: List[str],
+                 key_columns: Optional[Sequence[str]] = None):
+        """key_columns — заголовки ключа (юрлицо, артикул): строки с тем же ключом отдаются вместе с измененной"""
+        self.sheets = sheets
+        self.worksheet_name = worksheet_name
+        self.columns = columns
+        self.key_columns = key_columns
+        self.revision: Optional[str] = None
+        self._hashes: Optional[pd.Index] = None
+
+    def poll(self, force: bool = False) -> Optional[pd.DataFrame]:
+        """Строки, измененные с прошлой проверки; None — таблица не менялась.
+
+        force — читать лист без сверки ревизии и мимо кэша чтения (после
+        вебхука: modifiedTime в Drive может обновиться на пару секунд позже
+        самой правки).
+        Первая проверка возвращает все строки.
+        """
+        revision = self.sheets.modified_time()
+        if not force and revision == self.revision:
+            return None
+        df = self.sheets.get_data(self.worksheet_name, columns=self.columns, refresh=force, revision=revision)
+        hashes = pd.util.hash_pandas_object(df, index=False)
+        edited = df if self._hashes is None else df[~hashes.isin(self._hashes)]
+        if self.key_columns:
+            edited = with_key_groups(df, edited, self.key_columns)
+        self.revision = revision
+        self._hashes = pd.Index(hashes.values)
+        return edited
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        token = self.server.token
+        if token and self.headers.get('X-Cometa-Token') != token:
+            self.send_response(403)
+            self.end_headers()
+            return
+        # Тело не нужно: какие строки изменились, определяет SheetWatcher
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.on_edit()
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        log.debug(f"Вебхук: {format % args}")
+
+
+def start_webhook(port: int, on_edit: Callable[[], None], host: str = '127.0.0.1',
+                  token: Optional[str] = None) -> ThreadingHTTPServer:
+    """HTTP-сервер в фоновом потоке: каждый POST вызывает on_edit"""
+    server = ThreadingHTTPServer((host, port), _WebhookHandler)
+    server.on_edit = on_edit
+    server.token = token
+    threading.Thread(target=server.serve_forever, name='cometa-webhook', daemon=True).start()
+    log.info(f"Вебхук правок слушает {host}:{port}")
+    return server
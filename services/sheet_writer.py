@@ -0,0 +1,136 @@
+"""Инкрементальная запись таблицы на лист Google Sheets.
+
+Вместо полной перезаписи листа новые значения сравниваются с тем, что уже
+на листе (по локальному кэшу последней записи, а без него — по одному
+чтению листа), и отправляются только измененные прямоугольники одним
+batch_update. Отметка времени обновления уходит в том же запросе.
+
+Кэш действует, пока таблицу не меняли после нашей записи (sheet_cache).
+Если ее правили — вручную, сортировкой, очисткой, — лист читается заново,
+и расхождения исправляются следующей же записью. Лист читается без
+форматирования (UNFORMATTED_VALUE), и обе стороны сравнения приводятся
+через _cell: иначе «4,5» и «ИСТИНА» русской локали не совпали бы с 4.5 и
+TRUE, и каждая такая ячейка переписывалась бы заново.
+"""
+import os
+import time
+from typing import Any, Callable, List, Optional
+
+from gspread.utils import ValueRenderOption, rowcol_to_a1
+
+from cometa.services.logger import setup_logger
+from cometa.services.metrics import metrics
+from cometa.services.sheet_cache import OWN_WRITE_GRACE, carry_forward, drive_time, is_fresh, load, save
+
+log = setup_logger()
+
+DEFAULT_CACHE_DIR = '.sheet_cache'
+
+
+def _cell(value: Any) -> str:
+    """Значение ячейки в сравнимом виде: записываемое и прочитанное без форматирования"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class IncrementalSheetWriter:
+    def __init__(self, worksheet, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 modified_time: Optional[Callable[[], str]] = None):
+        """modified_time — время изменения таблицы (GoogleSheetClient.modified_time).
+
+        Без него или с cache_dir=None кэшу не доверяем: лист читается перед каждой записью.
+        """
+        self.worksheet = worksheet
+        self.modified_time = modified_time
+        self.cache_dir = cache_dir if modified_time else None
+        self.cache_path = None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.cache_path = os.path.join(
+                self.cache_dir, f"{worksheet.spreadsheet.id}_{worksheet.id}.json"
+            )
+
+    def _current(self, revision: Optional[str]) -> List[List[str]]:
+        cache = load(self.cache_path) if self.cache_path else None
+        if is_fresh(cache, revision):
+            return cache['rows']
+        if cache:
+            log.info(f"Лист '{self.worksheet.title}' менялся после последней записи: сверяемся с листом")
+        metrics.add('sheets_cache_misses', 1)
+        values = self.worksheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+        return [[_cell(v) for v in row] for row in values]
+
+    def _remember(self, rows: List[List[str]], revision: str, written: bool) -> None:
+        """Сохраняет записанное и границу свежести.
+
+        Без записи лист совпадает с кэшем на момент revision. После записи граница —
+        ее окончание с запасом на запаздывание modifiedTime; modifiedTime сразу после
+        записи не читается: Drive отдал бы еще старое значение.
+        """
+        previous = load(self.cache_path)
+        valid_until = drive_time(revision)
+        if previous and not written:
+            valid_until = max(valid_until, previous['valid_until'])
+        if written:
+            valid_until = time.time() + OWN_WRITE_GRACE
+            carry_forward(self.cache_dir, self.worksheet.spreadsheet.id, revision, valid_until, skip=self.cache_path)
+        save(self.cache_path, {'valid_until': valid_until, 'rows': rows})
+
+    @metrics.timed('sheets_write')
+    def write(self, rows: List[List[Any]], stamp: Optional[str] = None) -> int:
+        """Записывает rows начиная с A1; stamp — в первую строку последней колонки листа.
+
+        Строки и колонки, которые были на листе и исчезли из rows, очищаются.
+        Возвращает количество отправленных диапазонов.
+        """
+        revision = self.modified_time() if self.cache_path else None
+        old = self._current(revision)
+        rows = [list(row) for row in rows]
+        stamp_col = self.worksheet.col_count if stamp is not None else 0
+
+        height = max(len(rows), len(old))
+        width = max([len(r) for r in rows] + [len(r) for r in old] + [stamp_col, 0])
+        new = [row + [''] * (width - len(row)) for row in rows]
+        new += [[''] * width for _ in range(height - len(new))]
+        if stamp is not None and height:
+            new[0][stamp_col - 1] = stamp
+
+        # Для каждой строки — границы измененного участка; соседние строки склеиваются в прямоугольник
+        spans = []
+        for i, row in enumerate(new):
+            before = old[i] if i < len(old) else []
+            changed = [j for j, value in enumerate(row)
+                       if _cell(value) != _cell(before[j] if j < len(before) else '')]
+            spans.append((changed[0], changed[-1]) if changed else None)
+
+        data = []
+        i = 0
+        while i < height:
+            if spans[i] is None:
+                i += 1
+                continue
+            top, left, right = i, spans[i][0], spans[i][1]
+            while i + 1 < height and spans[i + 1] is not None:
+                i += 1
+                left, right = min(left, spans[i][0]), max(right, spans[i][1])
+            data.append({
+                'range': f"{rowcol_to_a1(top + 1, left + 1)}:{rowcol_to_a1(i + 1, right + 1)}",
+                'values': [row[left:right + 1] for row in new[top:i + 1]],
+            })
+            i += 1
+
+        if data:
+            if height > self.worksheet.row_count:
+                self.worksheet.add_rows(height - self.worksheet.row_count)
+            self.worksheet.batch_update(data)
+            metrics.add('sheets_ranges_written', len(data))
+        log.info(f"Лист '{self.worksheet.title}': обновлено диапазонов {len(data)}")
+
+        if self.cache_path:
+            self._remember([[_cell(v) for v in row] for row in new], revision, written=bool(data))
+        return len(data)
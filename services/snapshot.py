@@ -0,0 +1,164 @@
+"""Снимок текущих настроек автопилотов: Комета → лист и история в БД.
+
+Полный снимок выгружает все работающие автопилоты на лист «Текущие настройки
+автопилота», сохраняет их в БД и обновляет лист со вчерашним снимком.
+SnapshotJob помнит последний полный снимок, поэтому после отправки настроек
+можно обновить только затронутые артикулы: в БД уходят лишь их строки, а на
+листе меняются только их ячейки.
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from cometa.main.utils_sql import copy_upsert_dataframe, db_connection, get_db_table
+from cometa.services.logger import setup_logger
+from cometa.services.metrics import metrics
+from cometa.services.settings_diff import SettingsKey, settings_key
+from cometa.services.sheet_writer import IncrementalSheetWriter
+
+log = setup_logger()
+
+CURRENT_SHEET = 'Текущие настройки автопилота'
+YESTERDAY_SHEET = 'Вчерашние настройки автопилота'
+TABLE_DB = 'cometa_current_settings_one'
+
+# Итоговый набор колонок снимка (лист и таблица истории в БД)
+SNAPSHOT_COLUMNS = ['api_key_id', 'product_id', 'active', 'status', 'target_drr', 'target_cost_override', 'min_rem', 'deposit_type', 'min_daily_cost', 'max_daily_cost',
+                    'search_min_share', 'brand_traffic', 'budget_spent_today', 'target_cost', 'cost_to_target_pct_today',
+                    'min_daily_cost_price', 'min_daily_cost_date_from', 'target_cost_date', 'target_drr_date', 'date']
+NUMBER_COLUMNS = ['target_drr', 'min_daily_cost', 'max_daily_cost', 'target_cost']
+STRING_COLUMNS = ['date', 'target_cost_date', 'target_drr_date', 'deposit_type']
+
+
+def process_autopilot(record: dict) -> dict:
+    """Плоская строка снимка из записи GET /v1/autopilots"""
+    row = dict(record)
+    # Извлекаем из списка словарей значения по ключу 'min_daily_cost'
+    row['min_daily_cost_price'] = record['min_daily_cost'][0]['cost']
+    row['min_daily_cost_date_from'] = record['min_daily_cost'][0]['date']
+
+    target_cost = record.get('target_cost_override')
+    row['target_cost_date'] = (
+        target_cost[0]['date']
+        if isinstance(target_cost, list) and len(target_cost) > 0 and isinstance(target_cost[0], dict) and 'date' in target_cost[0]
+        else np.nan
+    )
+
+    # target_drr
+    target_drr = record.get('target_drr')
+    has_drr = isinstance(target_drr, list) and len(target_drr) > 0
+    row['target_drr_date'] = target_drr[0]['date'] if has_drr else None
+    row['target_drr'] = float(target_drr[0]['drr']) if has_drr else None
+
+    # dict → JSON
+    for col in ['target_cost_override', 'min_rem']:
+        value = record.get(col)
+        row[col] = json.dumps(value) if isinstance(value, (dict, list)) else None
+    return row
+
+
+def snapshot_frame(rows: Iterable[dict], today: str) -> pd.DataFrame:
+    """Типизированный снимок: числа — числами, пропуски — NaN (в БД уйдут как NULL)"""
+    df = pd.DataFrame.from_records(rows)
+    df['date'] = today
+    df = df.sort_values(by='max_daily_cost', ascending=False)
+    # Конвертируем в числа (используем точку как разделитель)
+    for col in NUMBER_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def sheet_rows(df: pd.DataFrame) -> list:
+    """Снимок в виде строк листа: заголовок + значения"""
+    df = df.copy()
+    for col in STRING_COLUMNS:
+        df[col] = df[col].astype(str)
+    df = df.fillna('')[SNAPSHOT_COLUMNS]
+    return [df.columns.values.tolist()] + df.values.tolist()
+
+
+def _key_mask(df: pd.DataFrame, keys: Set[SettingsKey]) -> np.ndarray:
+    index = pd.MultiIndex.from_arrays([df['api_key_id'].astype(int), df['product_id'].astype(int)])
+    return index.isin(list(keys))
+
+
+class SnapshotJob:
+    def __init__(self, context):
+        self.context = context
+        # Последний снимок (типизированный) — основа для точечных обновлений
+        self.frame: Optional[pd.DataFrame] = None
+        self._table = None
+        self._worksheets: Dict[str, object] = {}
+
+    def _worksheet(self, name: str):
+        if self._table is None:
+            self._table = self.context.sheets.open()
+        if name not in self._worksheets:
+            self._worksheets[name] = self._table.worksheet(name)
+        return self._worksheets[name]
+
+    def run(self, keys: Optional[Set[SettingsKey]] = None) -> int:
+        """Снимок всех автопилотов или, если задан keys, только этих (api_key_id, product_id).
+
+        Возвращает количество строк, сохраненных в БД.
+        """
+        if keys is not None and self.frame is None:
+            log.info("Полного снимка еще нет — выгружаем все автопилоты")
+            keys = None
+        if keys is not None and not keys:
+            return 0
+
+        metrics.reset()
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        stamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        cometa = self.context.cometa
+
+        if keys is None:
+            # Остановленные автопилоты отбрасываются при разборе ответа и не попадают в память
+            with metrics.stage('cometa_download'):
+                changed = snapshot_frame(
+                    (process_autopilot(record) for record in cometa.iter_autopilots(skip_statuses=['stopped'])), today
+                )
+            df = changed
+        else:
+            # Статус не фильтруем на стороне клиента: остановленный после отправки артикул нужно убрать с листа
+            with metrics.stage('cometa_download'):
+                rows = [
+                    process_autopilot(record) for record in cometa.iter_autopilots()
+                    if settings_key(record) in keys and record.get('status') != 'stopped'
+                ]
+            changed = snapshot_frame(rows, today) if rows else self.frame.iloc[0:0]
+            df = pd.concat([self.frame[~_key_mask(self.frame, keys)], changed])
+            df['date'] = today
+            df = df.sort_values(by='max_daily_cost', ascending=False)
+
+        # Отправляются только изменившиеся ячейки; дата и время обновления уходят в том же запросе
+        IncrementalSheetWriter(self._worksheet(CURRENT_SHEET), modified_time=self.context.sheets.modified_time).write(
+            sheet_rows(df), stamp=stamp)
+        log.info(f"Лист '{CURRENT_SHEET}' обновлен: {stamp}")
+
+        yesterday = (now - timedelta(days=1)).strftime('%Y-%m-%d')
+        with db_connection() as connection:
+            # Сохраняем снимок в историю одним COPY (upsert по date, api_key_id, product_id)
+            written = copy_upsert_dataframe(connection, changed[SNAPSHOT_COLUMNS], TABLE_DB)
+            if keys is None:
+                query = f"""SELECT * FROM {TABLE_DB}
+    WHERE date = %s AND status IS NOT NULL"""
+                df_yesterday = get_db_table(query, connection, params=(yesterday,))
+        self.frame = df
+
+        if keys is None:
+            # Числа уже приходят числами; в строки переводим только нечисловые колонки (даты и т.п.)
+            object_columns = df_yesterday.select_dtypes(include=['object', 'datetime', 'datetimetz']).columns
+            df_yesterday[object_columns] = df_yesterday[object_columns].astype(str)
+            IncrementalSheetWriter(self._worksheet(YESTERDAY_SHEET), modified_time=self.context.sheets.modified_time).write(
+                [df_yesterday.columns.values.tolist()] + df_yesterday.values.tolist(), stamp=stamp
+            )
+            log.info(f"Лист '{YESTERDAY_SHEET}' обновлен: {stamp}")
+        metrics.add('rows_snapshot', len(df))
+        metrics.write_report('snapshot' if keys is None else 'snapshot_targeted')
+        return written
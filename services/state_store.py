@@ -0,0 +1,71 @@
+"""Локальное хранилище последних отправленных настроек.
+
+SQLite-файл с одной строкой на пару (api_key_id, product_id): хэш канонических
+настроек и время успешной отправки. Каждый батч, получивший 200, фиксируется
+отдельной транзакцией, поэтому после падения посреди отправки повторный
+запуск в дельта-режиме «state» досылает только то, что не успело уйти.
+"""
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from cometa.services.settings_diff import SettingsKey, settings_hash, settings_key
+
+DEFAULT_STATE_PATH = 'cometa_state.sqlite3'
+
+
+class StateStore:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('COMETA_STATE_DB', DEFAULT_STATE_PATH)
+        self.conn = sqlite3.connect(self.path)
+        # WAL: запись батча не блокирует чтение и переживает падение процесса
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS applied_settings (
+                api_key_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                payload_hash TEXT NOT NULL,
+                pushed_at TEXT NOT NULL,
+                PRIMARY KEY (api_key_id, product_id)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def load(self) -> Dict[SettingsKey, str]:
+        """Все известные хэши одним запросом — для сравнения в дельта-режиме"""
+        rows = self.conn.execute("SELECT api_key_id, product_id, payload_hash FROM applied_settings")
+        return {(api_id, prod_id): payload_hash for api_id, prod_id, payload_hash in rows}
+
+    def pushed_at(self) -> Dict[SettingsKey, str]:
+        """Время последней успешной отправки каждой пары (ISO, до секунд)"""
+        rows = self.conn.execute("SELECT api_key_id, product_id, pushed_at FROM applied_settings")
+        return {(api_id, prod_id): pushed for api_id, prod_id, pushed in rows}
+
+    def get(self, key: SettingsKey) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT payload_hash FROM applied_settings WHERE api_key_id = ? AND product_id = ?", key
+        ).fetchone()
+        return row[0] if row else None
+
+    def holds(self, batch: Iterable[dict], today: Optional[str] = None) -> bool:
+        """Последняя успешная отправка каждой строки батча — ровно эти настройки"""
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        return all(self.get(settings_key(p)) == settings_hash(p, today) for p in batch)
+
+    def record_batch(self, batch: Iterable[dict], today: Optional[str] = None) -> None:
+        """Фиксирует успешно отправленный батч одной транзакцией"""
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        pushed_at = datetime.now().isoformat(timespec='seconds')
+        rows = [(*settings_key(p), settings_hash(p, today), pushed_at) for p in batch]
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO applied_settings (api_key_id, product_id, payload_hash, pushed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (api_key_id, product_id)
+                DO UPDATE SET payload_hash = excluded.payload_hash, pushed_at = excluded.pushed_at
+            """, rows)
+
+    def close(self) -> None:
+        self.conn.close()
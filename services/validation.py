@@ -0,0 +1,115 @@
+"""Проверка строк перед отправкой в Комету.
+
+Все, что сервер отверг бы ответом 400/422, отсеивается локально, до
+нарезки батчей: ID вне допустимого диапазона, нераспознанные даты,
+ДРР и расходы вне диапазонов, неизвестный счет автопополнения, неполные
+пары размер/количество. ДРР 0 (так останавливают автопилот) и минимальный
+расход больше максимального (в том числе максимум 0) API принимает — такие
+строки проходят.
+Отклоненная строка попадает в отчет с полем, значением и причиной; в
+отправку уходят только чистые. Повторы ключа (api_key_id, product_id)
+сливаются следующим этапом (settings_merge).
+
+Даты, которые распознаются (ДД.ММ.ГГГГ, 2026-1-5), приводятся к ISO.
+"""
+import math
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+from cometa.services.autopilot_settings import AutopilotSettings
+from cometa.services.settings_diff import DATED_FIELDS
+from cometa.services.settings_parser import DEPOSIT_TYPES, Exclusion, ParseResult, to_iso_date
+
+# Ключи хранятся в INTEGER SQLite и bigint PostgreSQL
+MAX_ID = 2 ** 63 - 1
+MAX_DRR = 100
+# Счета, которые принимает API: в примененных настройках встречается и promo, которого нет среди значений листа
+API_DEPOSIT_TYPES = frozenset(DEPOSIT_TYPES) | {'promo'}
+
+REASON_ID = "Недопустимый идентификатор"
+REASON_DATE = "Нераспознанная дата"
+REASON_NUMBER = "Значение не число"
+REASON_DRR = f"ДРР вне диапазона [0, {MAX_DRR}]"
+REASON_COST = "Отрицательный расход"
+REASON_DEPOSIT = f"Счет автопополнения не из {sorted(API_DEPOSIT_TYPES)}"
+REASON_MIN_REM = "Неполная пара размер/количество"
+
+# Отказ: (поле, значение, причина)
+Problem = Tuple[str, Any, str]
+
+# Разных дат на листе единицы, а strptime дорогой: каждая строка даты разбирается один раз
+_iso_date = lru_cache(maxsize=4096)(to_iso_date)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= MAX_ID
+
+
+def _check_dated(settings: AutopilotSettings, name: str, value_name: str) -> Optional[Problem]:
+    """Список [{"date": ..., value_name: ...}]: дата приводится к ISO, значение проверяется по диапазону"""
+    for entry in getattr(settings, name) or ():
+        date = entry.get('date')
+        iso = _iso_date(date) if isinstance(date, str) else None
+        if iso is None:
+            return f"{name}.date", date, REASON_DATE
+        entry['date'] = iso
+        value = entry.get(value_name)
+        if not _is_number(value):
+            return f"{name}.{value_name}", value, REASON_NUMBER
+        if name == 'target_drr' and not 0 <= value <= MAX_DRR:
+            return f"{name}.{value_name}", value, REASON_DRR
+        if value_name == 'cost' and value < 0:
+            return f"{name}.{value_name}", value, REASON_COST
+    return None
+
+
+def check_settings(settings: AutopilotSettings) -> Optional[Problem]:
+    """Первая найденная проблема строки или None"""
+    for name in ('api_key_id', 'product_id'):
+        value = getattr(settings, name)
+        if not _is_id(value):
+            return name, value, REASON_ID
+
+    for name, value_name in DATED_FIELDS.items():
+        problem = _check_dated(settings, name, value_name)
+        if problem:
+            return problem
+
+    max_cost = settings.max_daily_cost
+    if max_cost is not None:
+        if not _is_number(max_cost):
+            return 'max_daily_cost', max_cost, REASON_NUMBER
+        if max_cost < 0:
+            return 'max_daily_cost', max_cost, REASON_COST
+
+    if settings.deposit_type is not None and (
+        not settings.deposit_type or any(d not in API_DEPOSIT_TYPES for d in settings.deposit_type)
+    ):
+        return 'deposit_type', settings.deposit_type, REASON_DEPOSIT
+
+    for entry in settings.min_rem or ():
+        size, quantity = entry.get('size'), entry.get('quantity')
+        if not isinstance(size, str) or not size.strip() or size.strip() == 'nan' \
+                or not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+            return 'min_rem', entry, REASON_MIN_REM
+    return None
+
+
+def validate_settings(parsed: ParseResult) -> ParseResult:
+    """Проверяет все строки; возвращает только чистые, отказы добавляются к exclusions"""
+    rows = parsed.rows or [None] * len(parsed.settings)
+    result = ParseResult(exclusions=list(parsed.exclusions))
+    for row_index, settings in zip(rows, parsed.settings):
+        problem = check_settings(settings)
+        if problem:
+            field_name, value, reason = problem
+            result.exclusions.append(Exclusion(row_index, settings.product_id, reason,
+                                               api_key_id=settings.api_key_id, field=field_name, value=value))
+        else:
+            result.settings.append(settings)
+            result.rows.append(row_index)
+    return result
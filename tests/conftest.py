@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Тесты запускаются из папки репозитория (python -m pytest): она регистрируется как пакет cometa,
+# как и в скриптах запуска
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import cometa_bootstrap  # noqa: E402,F401
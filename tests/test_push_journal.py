@@ -0,0 +1,34 @@
+"""Очередь журнала: что не получило ответа сервера, остается для --resume"""
+import time
+
+from cometa.services.push_journal import PushJournal
+
+
+def payload(product_id, cost):
+    return {'api_key_id': 5, 'product_id': product_id, 'max_daily_cost': cost}
+
+
+def test_answered_rows_leave_the_queue(tmp_path):
+    journal = PushJournal(str(tmp_path / 'state.db'))
+    journal.enqueue([payload(1, 100), payload(2, 200), payload(3, 300)])
+    journal.dequeue([payload(1, 100), payload(3, 300)])
+    assert journal.queued() == [payload(2, 200)]
+
+
+def test_newer_version_of_a_key_is_not_dequeued_by_an_older_answer(tmp_path):
+    journal = PushJournal(str(tmp_path / 'state.db'))
+    journal.enqueue([payload(1, 100)])
+    journal.enqueue([payload(1, 150)])
+    journal.dequeue([payload(1, 100)])
+    assert journal.queued() == [payload(1, 150)]
+    # Досылка незавершенного батча не затирает более новую версию
+    journal.enqueue([payload(1, 100)], replace=False)
+    assert journal.queued() == [payload(1, 150)]
+
+
+def test_stale_rows_are_pruned(tmp_path):
+    journal = PushJournal(str(tmp_path / 'state.db'), max_age=1)
+    journal.enqueue([payload(1, 100)])
+    journal.conn.execute("UPDATE push_queue SET queued_at = ?", (time.time() - 7200,))
+    assert journal.prune() == 1
+    assert journal.queued() == []
@@ -0,0 +1,51 @@
+"""merge_duplicates: побеждает нижняя строка, пустые поля объединяются, слитая запись проверяется заново"""
+from cometa.services.autopilot_settings import AutopilotSettings
+from cometa.services.settings_merge import REASON_CONFLICT, REASON_MERGED, merge_duplicates
+from cometa.services.settings_parser import ParseResult
+
+REASON_TEST = "Тестовое правило"
+
+
+def settings(product_id=238877732, **fields) -> AutopilotSettings:
+    return AutopilotSettings(api_key_id=5919, product_id=product_id, **fields)
+
+
+def test_lower_row_wins_and_empty_fields_are_merged():
+    upper = settings(active=True, max_daily_cost=1000)
+    lower = settings(max_daily_cost=1800, deposit_type=['net'])
+    other = settings(product_id=338690375, max_daily_cost=3000)
+    parsed = ParseResult(settings=[upper, other, lower], rows=[0, 1, 2])
+
+    result = merge_duplicates(parsed)
+
+    assert result.settings == [settings(active=True, max_daily_cost=1800, deposit_type=['net']), other]
+    assert result.rows == [2, 1]
+    [exclusion] = result.exclusions
+    assert (exclusion.row_index, exclusion.reason, exclusion.field) == (0, REASON_CONFLICT, 'max_daily_cost')
+    assert exclusion.value == {'row': 4, 'max_daily_cost': [1000, 1800]}
+    # Исходные записи разбора не меняются
+    assert upper.max_daily_cost == 1000 and upper.deposit_type is None
+
+
+def test_equal_values_are_not_a_conflict():
+    parsed = ParseResult(settings=[settings(max_daily_cost=1000), settings(max_daily_cost=1000, active=False)],
+                         rows=[5, 9])
+    result = merge_duplicates(parsed)
+    assert result.settings == [settings(max_daily_cost=1000, active=False)]
+    assert [(e.row_index, e.reason, e.value) for e in result.exclusions] == [(5, REASON_MERGED, {'row': 11})]
+
+
+def test_merged_record_is_checked_again():
+    def no_inactive_with_budget(item):
+        if item.active is False and item.max_daily_cost:
+            return 'active', item.active, REASON_TEST
+        return None
+
+    # Каждая строка по отдельности правило проходит, вместе — нет
+    parsed = ParseResult(settings=[settings(max_daily_cost=1000), settings(active=False),
+                                   settings(product_id=338690375, active=False)], rows=[0, 1, 2])
+    result = merge_duplicates(parsed, check=no_inactive_with_budget)
+
+    assert result.settings == [settings(product_id=338690375, active=False)]
+    assert result.rows == [2]
+    assert [(e.row_index, e.reason) for e in result.exclusions] == [(0, REASON_MERGED), (1, REASON_TEST)]
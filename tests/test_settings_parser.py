@@ -0,0 +1,26 @@
+"""Колоночный парсер дает ровно то же, что прежние построчные циклы iterrows"""
+from datetime import datetime
+
+import pytest
+
+from cometa.benchmarks.bench_settings_parser import legacy_build_params, legacy_parse_settings, make_sheet
+from cometa.services.settings_parser import build_params, parse_settings
+
+ROWS = 1000
+
+
+@pytest.mark.parametrize('dirty', [True, False], ids=['dirty', 'clean'])
+def test_parse_settings_matches_legacy(dirty):
+    df = make_sheet(ROWS, dirty=dirty)
+    old_payload, old_exclusions = legacy_parse_settings(df)
+
+    parsed = parse_settings(df, datetime.now().strftime("%Y-%m-%d"))
+
+    assert [s.to_api_dict() for s in parsed.settings] == old_payload
+    assert [(e.row_index, e.product_id, e.reason) for e in parsed.exclusions] == old_exclusions
+
+
+def test_build_params_matches_legacy():
+    # На грязном листе прежний build_params падал, сверять можно только чистый
+    df = make_sheet(ROWS, dirty=False)
+    assert build_params(df, datetime.now().strftime("%Y-%m-%d")) == legacy_build_params(df)
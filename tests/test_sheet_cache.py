@@ -0,0 +1,34 @@
+"""Кэш чтения листа настроек переживает запись листов снимка в ту же таблицу"""
+import os
+
+from cometa.benchmarks.fakes import FakeSheets
+from cometa.services import sheet_cache
+from cometa.services.sheet_writer import IncrementalSheetWriter
+
+
+def test_snapshot_write_keeps_reader_cache_fresh(tmp_path):
+    sheets = FakeSheets()
+    reader_meta = os.path.join(tmp_path, f"{sheets.spreadsheet.id}_Настройки.json")
+    # Так кэш оставляет GoogleSheetClient после чтения листа
+    sheet_cache.save(reader_meta, {'valid_until': sheet_cache.drive_time(sheets.modified_time()),
+                                   'columns': ['Артикул'], 'header': ['Артикул']})
+
+    writer = IncrementalSheetWriter(sheets.open().worksheet('Текущие'), cache_dir=str(tmp_path),
+                                    modified_time=sheets.modified_time)
+    assert writer.write([['Артикул', 'Бюджет'], [123, 4.5]]) == 1
+
+    assert sheet_cache.is_fresh(sheet_cache.load(reader_meta), sheets.modified_time())
+    assert sheet_cache.load(reader_meta)['columns'] == ['Артикул']
+
+
+def test_edit_after_write_invalidates_reader_cache(tmp_path):
+    sheets = FakeSheets()
+    reader_meta = os.path.join(tmp_path, f"{sheets.spreadsheet.id}_Настройки.json")
+    sheet_cache.save(reader_meta, {'valid_until': sheet_cache.drive_time(sheets.modified_time()),
+                                   'columns': [], 'header': []})
+    IncrementalSheetWriter(sheets.open().worksheet('Текущие'), cache_dir=str(tmp_path),
+                           modified_time=sheets.modified_time).write([['Артикул']])
+
+    # Правка листа позже окна на запаздывание modifiedTime после записи
+    sheets.spreadsheet.modified += sheet_cache.OWN_WRITE_GRACE + 60
+    assert not sheet_cache.is_fresh(sheet_cache.load(reader_meta), sheets.modified_time())
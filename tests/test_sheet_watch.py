@@ -0,0 +1,67 @@
+"""SheetWatcher в режиме --watch: правка строки отдается вместе с повторами ее ключа"""
+import pandas as pd
+
+from cometa.services.settings_merge import merge_duplicates
+from cometa.services.settings_parser import SHEET_COLUMNS, SHEET_KEY_COLUMNS, parse_settings
+from cometa.services.sheet_watch import SheetWatcher
+from cometa.services.validation import validate_settings
+
+
+class Sheets:
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self.revision = 0
+        self.revision_reads = 0
+
+    def modified_time(self) -> str:
+        self.revision_reads += 1
+        return str(self.revision)
+
+    def get_data(self, worksheet_name, columns=None, refresh=False, revision=None):
+        # Без переданной ревизии GoogleSheetClient запросил бы modifiedTime еще раз
+        if revision is None:
+            self.modified_time()
+        return self.frame.copy()
+
+
+def row(api_key_id, product_id, max_cost):
+    values = dict.fromkeys(SHEET_COLUMNS, '')
+    values.update({'Идентификатор юрлица': api_key_id, 'Артикул': product_id, 'Максимальный расход': max_cost})
+    return values
+
+
+def pushed_max(frame: pd.DataFrame):
+    merged = merge_duplicates(validate_settings(parse_settings(frame, '2026-01-08')))
+    return {(s.api_key_id, s.product_id): s.max_daily_cost for s in merged.settings}
+
+
+def test_editing_upper_duplicate_keeps_lower_row_winning():
+    sheets = Sheets(pd.DataFrame([row('5', '123', '1000'), row('7', '456', '300'), row('5', '123', '2000')]))
+    watcher = SheetWatcher(sheets, 'Настройки', list(SHEET_COLUMNS), key_columns=SHEET_KEY_COLUMNS)
+    assert pushed_max(watcher.poll()) == {(5, 123): 2000, (7, 456): 300}
+
+    sheets.frame.loc[0, 'Максимальный расход'] = '1500'
+    sheets.revision += 1
+    edited = watcher.poll()
+
+    # Нижняя строка того же ключа уходит вместе с правкой, посторонняя — нет
+    assert list(edited.index) == [0, 2]
+    assert pushed_max(edited) == {(5, 123): 2000}
+
+
+def test_key_match_ignores_number_formatting():
+    sheets = Sheets(pd.DataFrame([row('5', '123', '1000'), row(' 5', '123.0', '2000')]))
+    watcher = SheetWatcher(sheets, 'Настройки', list(SHEET_COLUMNS), key_columns=SHEET_KEY_COLUMNS)
+    watcher.poll()
+    sheets.frame.loc[1, 'Максимальный расход'] = '2500'
+    sheets.revision += 1
+    assert list(watcher.poll().index) == [0, 1]
+
+
+def test_poll_reads_revision_once():
+    sheets = Sheets(pd.DataFrame([row('5', '123', '1000')]))
+    watcher = SheetWatcher(sheets, 'Настройки', list(SHEET_COLUMNS), key_columns=SHEET_KEY_COLUMNS)
+    watcher.poll()
+    sheets.revision += 1
+    watcher.poll(force=True)
+    assert sheets.revision_reads == 2
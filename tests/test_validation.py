@@ -0,0 +1,86 @@
+"""check_settings / validate_settings на значениях, которые production API уже принимает.
+
+Значения взяты из cometa_change_settings_dashboard.log: остановленные
+автопилоты с ДРР 0.0, минимальный расход больше максимального (100/0, 1800/1000).
+"""
+import pandas as pd
+import pytest
+
+from cometa.services.autopilot_settings import AutopilotSettings
+from cometa.services.settings_parser import SHEET_COLUMNS, ParseResult, parse_settings
+from cometa.services.validation import (
+    REASON_COST, REASON_DATE, REASON_DEPOSIT, REASON_DRR, REASON_ID, REASON_MIN_REM, check_settings, validate_settings,
+)
+
+TODAY = '2026-01-08'
+
+
+def settings(**fields) -> AutopilotSettings:
+    return AutopilotSettings(**{'api_key_id': 9002, 'product_id': 238878239, **fields})
+
+
+def test_deactivation_with_zero_drr_passes():
+    # api_key_id 9002 / product_id 238878239: active false, drr 0.0, min 100 / max 0
+    row = settings(active=False, target_drr=[{'date': '2026-01-08', 'drr': 0.0}],
+                   deposit_type=['net', 'account', 'promo'],
+                   min_daily_cost=[{'date': TODAY, 'cost': 100.0}], max_daily_cost=0)
+    assert check_settings(row) is None
+
+
+def test_deactivation_row_from_sheet_is_sent():
+    row = dict.fromkeys(SHEET_COLUMNS, '')
+    row.update({'Идентификатор юрлица': '9002', 'Артикул': '238878239', 'Активность': '0',
+                'Дата, начиная с которой будет действовать целевой ДРР': '08.01.2026', 'Целевой ДРР': '0',
+                'Минимальный расход': '100', 'Максимальный расход': '0'})
+    result = validate_settings(parse_settings(pd.DataFrame([row]), TODAY))
+    assert result.exclusions == []
+    [parsed] = result.settings
+    assert (parsed.active, parsed.target_drr, parsed.max_daily_cost) == \
+        (False, [{'date': '2026-01-08', 'drr': 0.0}], 0)
+
+
+@pytest.mark.parametrize('min_cost, max_cost', [(100.0, 0), (1800.0, 1000)])
+def test_min_above_max_passes(min_cost, max_cost):
+    # 5919 / 238877732: min 1800 / max 1000, принято API
+    row = settings(api_key_id=5919, product_id=238877732, active=False,
+                   target_drr=[{'date': '2025-07-14', 'drr': 5.0}],
+                   target_cost_override=[{'date': '2025-06-27', 'cost': 937.0}], deposit_type=['net'],
+                   min_daily_cost=[{'date': TODAY, 'cost': min_cost}], max_daily_cost=max_cost)
+    assert check_settings(row) is None
+
+
+def test_working_autopilot_passes():
+    row = settings(product_id=338690375, active=True, target_drr=[{'date': '2026-01-06', 'drr': 6.0}],
+                   deposit_type=['net', 'account', 'promo'], max_daily_cost=3000)
+    assert check_settings(row) is None
+
+
+def test_sheet_date_is_normalised_to_iso():
+    row = settings(target_drr=[{'date': '06.01.2026', 'drr': 6.0}])
+    assert check_settings(row) is None
+    assert row.target_drr == [{'date': '2026-01-06', 'drr': 6.0}]
+
+
+@pytest.mark.parametrize('row, expected', [
+    (settings(product_id=10 ** 20), ('product_id', 10 ** 20, REASON_ID)),
+    (settings(api_key_id=0), ('api_key_id', 0, REASON_ID)),
+    (settings(target_drr=[{'date': '2026-13-45', 'drr': 6.0}]), ('target_drr.date', '2026-13-45', REASON_DATE)),
+    (settings(target_drr=[{'date': '2026-01-06', 'drr': -1.0}]), ('target_drr.drr', -1.0, REASON_DRR)),
+    (settings(target_drr=[{'date': '2026-01-06', 'drr': 101.0}]), ('target_drr.drr', 101.0, REASON_DRR)),
+    (settings(max_daily_cost=-5), ('max_daily_cost', -5, REASON_COST)),
+    (settings(deposit_type=['cash']), ('deposit_type', ['cash'], REASON_DEPOSIT)),
+    (settings(min_rem=[{'size': '', 'quantity': 10}]), ('min_rem', {'size': '', 'quantity': 10}, REASON_MIN_REM)),
+])
+def test_invalid_values_are_rejected(row, expected):
+    assert check_settings(row) == expected
+
+
+def test_validate_settings_keeps_clean_rows_and_reports_the_rest():
+    clean = settings(active=False, target_drr=[{'date': '2026-01-08', 'drr': 0.0}], max_daily_cost=0)
+    bad = settings(product_id=238877732, target_drr=[{'date': '2026-01-06', 'drr': 150.0}])
+    result = validate_settings(ParseResult(settings=[clean, bad], rows=[0, 1]))
+    assert result.settings == [clean]
+    assert result.rows == [0]
+    [exclusion] = result.exclusions
+    assert (exclusion.row_index, exclusion.product_id, exclusion.field, exclusion.reason) == \
+        (1, 238877732, 'target_drr.drr', REASON_DRR)